@@ -0,0 +1,256 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - end-to-end crawl benchmark
+## Filename: bench/bench_crawl.py
+##
+## Description:
+##          Crawls a local stand-in for the directory site (fake_directory)
+##          with the scraper's own pipeline, once per combination of fetch
+##          backend, parser and sink, and reports records/sec, the cost of
+##          every stage and peak memory for each. Every combination runs in
+##          its own process so their memory doesn't add up. Compared with a
+##          saved baseline it fails when records/sec drop, to catch
+##          performance regressions before they reach production.
+##
+##          python bench/bench_crawl.py [--profiles 1000] [--latency 0.02] [--workers 8]
+##                                      [--fetch http cache] [--parser html.parser lxml]
+##                                      [--sink none jsonl sql sqlite parquet]
+##                                      [--json PATH] [--baseline PATH] [--tolerance 0.2]
+##
+######################################################################################
+######################################################################################
+
+import os
+import sys
+import json
+import shutil
+import string
+import argparse
+import tempfile
+import itertools
+import subprocess
+import importlib.util
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH))
+import lw_fetch
+import lw_cache
+import lw_sinks
+import lw_metrics
+import lw_profile
+
+from fake_directory import FakeDirectory
+
+SCRAPER = os.path.join(os.path.dirname(BENCH), 'latham & watkins scrape.py')
+
+FETCHERS = ['http', 'cache', 'driver']
+SINKS = ['none', 'jsonl', 'sql', 'sqlite', 'parquet']
+
+## stages shown in the summary table, the report has all of them
+SHOWN_STAGES = ['fetch', 'parse', 'write']
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## the scraper script, imported as a module (its file name isn't a valid module name)
+def load_scraper():
+    spec = importlib.util.spec_from_file_location('lw_scrape', SCRAPER)
+    scraper = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(scraper)
+    return scraper
+
+
+def make_sink(name, folder):
+    if name == 'jsonl':
+        return lw_sinks.JsonLinesSink(os.path.join(folder, 'LW_Lawyers.jsonl'))
+    if name == 'sql':
+        return lw_sinks.SqlFileSink(os.path.join(folder, 'LW_Lawyers.sql'), rows_per_insert=100)
+    if name == 'sqlite':
+        return lw_sinks.DatabaseSink(lw_sinks.SqliteAdapter(os.path.join(folder, 'LW_Lawyers.db')))
+    if name == 'parquet':
+        return lw_sinks.ParquetSink(os.path.join(folder, 'LW_Lawyers.parquet'))
+    return lw_sinks.Tee([])
+
+
+## crawls the site at url once with the fetch backend, parser and sink, writing into folder.
+## Output: run report (lw_metrics.Metrics.report) with the number of records and records/sec
+def crawl(scraper, url, fetch, parser, sink_name, folder, workers, parse_workers, queue_size, cache=None,
+          replay=False, parse_processes=0):
+    lw_profile.DOMAIN = url
+    lw_profile.DIRECTORY = url + '/GlobalDirectory'
+    metrics = lw_metrics.Metrics()
+    session = lw_fetch.http_session(pool_size=workers)
+
+    ## the directory lists are plain pages on the stand-in, no clicking needed
+    def lawyers():
+        for letter in string.ascii_uppercase:
+            with metrics.timer('letter'):
+                links = lw_profile.parse_directory(session.get(lw_profile.DIRECTORY + '/' + letter, timeout=30).text)
+            for link in links:
+                yield link
+
+    records = 0
+    with make_sink(sink_name, folder) as sink:
+        for lawyer_info in scraper.iter_lawyers_info(
+                None, lawyers(), workers=workers, limiter=lw_fetch.HostLimiter(max_per_host=workers),
+                backend='driver' if fetch == 'driver' else 'http', parser=parser, cache=cache, replay=replay,
+                retries=0, parse_workers=parse_workers, parse_processes=parse_processes, queue_size=queue_size,
+                metrics=metrics):
+            with metrics.timer('write'):
+                sink.write(lawyer_info)
+            records += 1
+    session.close()
+
+    report = metrics.report(records=records)
+    report['records_per_sec'] = round(records / report['elapsed'], 3) if report['elapsed'] else 0.0
+    return report
+
+
+## runs one combination in this process and writes its report to out
+def run_one(args):
+    scraper = load_scraper()
+    folder = tempfile.mkdtemp(prefix='lw_bench_')
+    try:
+        if args.run[0] == 'cache':
+            ## fills the cache first, then times replaying the crawl from it
+            cache = lw_cache.PageCache(os.path.join(folder, 'cache'))
+            crawl(scraper, args.url, 'http', args.run[1], 'none', folder, args.workers, args.parse_workers,
+                  args.queue_size, cache=cache)
+            report = crawl(scraper, args.url, 'cache', args.run[1], args.run[2], folder, args.workers,
+                           args.parse_workers, args.queue_size, cache=cache, replay=True,
+                           parse_processes=args.parse_processes)
+            cache.close()
+        else:
+            report = crawl(scraper, args.url, args.run[0], args.run[1], args.run[2], folder, args.workers,
+                           args.parse_workers, args.queue_size, parse_processes=args.parse_processes)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    if not report['records']:
+        ## e.g. no chrome for the driver backend
+        sys.exit('No lawyer scraped, {} pages failed'.format(report['counters'].get('failures', 0)))
+    with open(args.out, 'w') as out:
+        json.dump(report, out)
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+def milliseconds(report, stage, percentile):
+    summary = report['stages'].get(stage)
+    return '{:.1f}'.format(summary[percentile] * 1000) if summary else '-'
+
+
+def print_table(results):
+    print('{:<28} {:>8} {:>10} {:>8}   {}'.format('backend/parser/sink', 'records', 'rec/sec', 'peak MB',
+                                                 '  '.join('{} p50/p95 ms'.format(stage) for stage in SHOWN_STAGES)))
+    for name, report in results.items():
+        if 'error' in report:
+            print('{:<28} skipped: {}'.format(name, report['error']))
+            continue
+        peak = report['peak_rss_bytes']
+        print('{:<28} {:>8} {:>10.1f} {:>8}   {}'.format(
+            name, report['records'], report['records_per_sec'],
+            '{:.0f}'.format(peak / 1024.0 / 1024.0) if peak is not None else '-',
+            '  '.join('{:>16}'.format(milliseconds(report, stage, 'p50') + '/' + milliseconds(report, stage, 'p95'))
+                      for stage in SHOWN_STAGES)))
+
+
+## Output: list of combinations whose records/sec fell more than tolerance below the baseline's
+def regressions(results, baseline, tolerance):
+    slower = []
+    for name, report in results.items():
+        before = baseline.get(name)
+        if 'error' in report or not before or 'error' in before:
+            continue
+        if report['records_per_sec'] < before['records_per_sec'] * (1 - tolerance):
+            slower.append('{}: {:.1f} rec/sec, baseline {:.1f}'.format(
+                name, report['records_per_sec'], before['records_per_sec']))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the scraper end to end against a local stand-in "
+                                                 "for the directory site.")
+    parser.add_argument('--profiles', type=int, default=1000,
+                        help="number of lawyers on the stand-in site, e.g. 100 to 100000 (default: 1000)")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds every request takes (default: 0.02)")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="up to this many more seconds at random per request (default: 0)")
+    parser.add_argument('--padding-kb', type=int, default=0,
+                        help="KB of navigation markup added to every lawyer page (default: 0)")
+    parser.add_argument('--workers', type=int, default=8, help="fetch workers (default: 8)")
+    parser.add_argument('--parse-workers', type=int, default=1, help="parse workers (default: 1)")
+    parser.add_argument('--parse-processes', type=int, default=0,
+                        help="parse in this many worker processes, 0 parses in the crawling process (default: 0)")
+    parser.add_argument('--queue-size', type=int, default=16, help="pipeline queue size (default: 16)")
+    parser.add_argument('--fetch', nargs='+', choices=FETCHERS, default=['http', 'cache'],
+                        help="fetch backends to compare, driver needs chrome (default: http cache)")
+    parser.add_argument('--parser', nargs='+', default=['html.parser', 'lxml'],
+                        help="BeautifulSoup parsers to compare (default: html.parser lxml)")
+    parser.add_argument('--sink', nargs='+', choices=SINKS, default=SINKS,
+                        help="sinks to compare (default: all)")
+    parser.add_argument('--json', metavar='PATH', help="save the reports of every combination to this file")
+    parser.add_argument('--baseline', metavar='PATH',
+                        help="reports saved with --json earlier. Exits with status 1 if a combination got slower")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="fraction of the baseline's records/sec a combination may lose (default: 0.2)")
+    ## used internally to run one combination in a child process
+    parser.add_argument('--run', nargs=3, metavar=('FETCH', 'PARSER', 'SINK'), help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(args)
+        return
+
+    common = ['--workers', str(args.workers), '--parse-workers', str(args.parse_workers),
+              '--parse-processes', str(args.parse_processes), '--queue-size', str(args.queue_size)]
+    results = {}
+    with FakeDirectory(args.profiles, latency=args.latency, jitter=args.jitter, padding_kb=args.padding_kb) as site:
+        print('{} profiles served at {}, {:.0f} ms latency, {} workers'.format(
+            args.profiles, site.url, args.latency * 1000, args.workers))
+        for fetch, parser_name, sink in itertools.product(args.fetch, args.parser, args.sink):
+            name = '/'.join([fetch, parser_name, sink])
+            with tempfile.NamedTemporaryFile(suffix='.json', prefix='lw_bench_', delete=False) as report:
+                out = report.name
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', fetch, parser_name, sink,
+                                    '--url', site.url, '--out', out] + common,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+            if child.returncode == 0:
+                with open(out) as report:
+                    results[name] = json.load(report)
+            else:
+                ## e.g. lxml or chrome not installed
+                lines = child.stdout.strip().splitlines()
+                results[name] = {'error': lines[-1] if lines else 'exit status {}'.format(child.returncode)}
+            os.remove(out)
+            if 'error' not in results[name]:
+                print('  {:<28} {:.1f} rec/sec'.format(name, results[name]['records_per_sec']))
+
+    print()
+    print_table(results)
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump({'profiles': args.profiles, 'latency': args.latency, 'workers': args.workers,
+                       'scenarios': results}, out, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            slower = regressions(results, json.load(baseline)['scenarios'], args.tolerance)
+        if slower:
+            print()
+            print('Slower than the baseline:')
+            for line in slower:
+                print('  ' + line)
+            sys.exit(1)
+#######################################################################################################################
+
+
+#######################################################################################################################
+if __name__ == '__main__':
+    main()
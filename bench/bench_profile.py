@@ -0,0 +1,76 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - profile parser micro-benchmark
+## Filename: bench/bench_profile.py
+##
+## Description:
+##          Parses the saved lawyer pages in bench/fixtures over and over
+##          with lw_profile and reports how many profiles/sec each
+##          BeautifulSoup parser gets through.
+##
+##          python bench/bench_profile.py [--parser html.parser lxml] [--seconds 2]
+##
+######################################################################################
+######################################################################################
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lw_profile
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## parses every page in pages until at least seconds have gone by
+## Output: number of profiles parsed and time it took
+def run(pages, parser, seconds):
+    count = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        for name, html in pages:
+            lw_profile.parse_profile(html, name, parser=parser)
+        count += len(pages)
+        elapsed = time.perf_counter() - start
+    return count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks lw_profile on the saved lawyer pages.")
+    parser.add_argument('--parser', nargs='+', default=['html.parser', 'lxml'],
+                        help="BeautifulSoup parsers to compare (default: html.parser lxml)")
+    parser.add_argument('--seconds', type=float, default=2.0, help="time spent on each parser (default: 2)")
+    parser.add_argument('--fixtures', default=FIXTURES, help="folder of saved lawyer pages")
+    args = parser.parse_args()
+
+    pages = []
+    for path in sorted(glob.glob(os.path.join(args.fixtures, '*.html'))):
+        with open(path, encoding='utf-8') as page:
+            pages.append((os.path.basename(path), page.read()))
+    if not pages:
+        sys.exit('No .html fixtures in ' + args.fixtures)
+
+    print('{} fixtures, {} KB'.format(len(pages), sum(len(html) for _, html in pages) // 1024))
+    for name in args.parser:
+        try:
+            count, elapsed = run(pages, name, args.seconds)
+        except Exception as err:
+            ## e.g. lxml not installed
+            print('{:<12} skipped: {}'.format(name, err))
+            continue
+        print('{:<12} {:>8.1f} profiles/sec  ({} profiles in {:.2f}s)'.format(
+            name, count / elapsed, count, elapsed))
+#######################################################################################################################
+
+
+#######################################################################################################################
+if __name__ == '__main__':
+    main()
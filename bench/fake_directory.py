@@ -0,0 +1,289 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - local stand-in for the directory site
+## Filename: bench/fake_directory.py
+##
+## Description:
+##          Serves synthetic Latham-style pages from a local http server so
+##          the scraper can be benchmarked without touching www.lw.com: a
+##          PeopleList table for every letter of the global directory and a
+##          lawyer's webpage (RightColumnMainContent, AttorneyMetaData lists,
+##          the ..._AdditionalInfoSectionWrapper sections) for every one of
+##          the profiles, and their pictures. Pages are generated from the
+##          lawyer's number, so the same profiles come back every time, with
+##          an ETag, after a configurable latency.
+##
+##          with FakeDirectory(profiles=1000, latency=0.02) as site:
+##              site.url + '/GlobalDirectory/Q', site.url + site.links('Q')[0]
+##
+##          python bench/fake_directory.py --profiles 1000 --port 8765
+##
+######################################################################################
+######################################################################################
+
+import argparse
+import random
+import string
+import struct
+import threading
+import time
+import zlib
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+#######################################################################################################################
+#######################################################################################################################
+
+FIRST_NAMES = ['Jane', 'John', 'Maria', 'Wei', 'Aisha', 'Lars', 'Priya', 'Tom', 'Elena', 'Kenji', 'Sofia', 'Omar']
+TITLES = ['Partner', 'Associate', 'Counsel', 'Of Counsel', 'Senior Counsel']
+OFFICES = ['London', 'New York', 'Washington, D.C.', 'Hong Kong', 'Paris', 'Frankfurt', 'Tokyo', 'Chicago',
+           'Los Angeles', 'Singapore', 'Madrid', 'Milan']
+BARS = ['New York', 'California', 'Solicitor (England and Wales)', 'District of Columbia', 'Illinois',
+        'Avocat au Barreau de Paris', 'Rechtsanwalt (Germany)']
+SCHOOLS = ['Harvard Law School', 'Yale University', 'Columbia Law School', 'University of Oxford',
+           'Stanford Law School', 'University of Chicago', 'Georgetown University Law Center']
+PRACTICES = ['Mergers & Acquisitions', 'Private Equity', 'Capital Markets', 'Litigation & Trial', 'Antitrust',
+             'Banking', 'Tax', 'Restructuring', 'Intellectual Property', 'Real Estate']
+INDUSTRIES = ['Technology', 'Healthcare & Life Sciences', 'Energy', 'Financial Institutions', 'Media',
+              'Aviation']
+SECTIONS = [('EventsSection', 'Events'), ('NewsSection', 'News'),
+            ('ThoughtLeadershipSection', 'Thought Leadership'), ('AwardsRankingsSection', 'Awards & Rankings')]
+SECTION_ID = 'ContentPlaceHolder1_RightColumnNavigationPlaceHolder_AdditionalInfoControl1_{}_AdditionalInfoSectionWrapper'
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## profiles lawyers spread over the letters A-Z (lawyer i's last name starts with letter i % 26), served at url once
+## started. Every request waits latency seconds plus up to jitter more. seed changes the generated profiles and
+## padding_kb adds that much navigation/footer markup outside RightColumnMainContent to every lawyer's webpage, to
+## bring it to the weight of the real pages
+class FakeDirectory(object):
+
+    def __init__(self, profiles=1000, latency=0.0, jitter=0.0, seed=0, padding_kb=0, host='127.0.0.1', port=0):
+        self.profiles = profiles
+        self.latency = latency
+        self.jitter = jitter
+        self.seed = seed
+        link = '<li><a href="/offices/footer">Office link</a></li>'
+        self.padding = '<ul id="Footer">{}</ul>'.format(link * (padding_kb * 1024 // len(link))) if padding_kb else ''
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-directory')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    ## Output: links of the lawyers whose last name starts with letter, as the directory lists them
+    def links(self, letter):
+        first = string.ascii_uppercase.index(letter.upper())
+        return [self._path(number) for number in range(first, self.profiles, 26)]
+
+    def _name(self, number):
+        rng = random.Random(self.seed * 1000003 + number)
+        last = string.ascii_uppercase[number % 26] + ''.join(rng.choice(string.ascii_lowercase) for _ in range(6))
+        return rng.choice(FIRST_NAMES), last
+
+    def _path(self, number):
+        first, last = self._name(number)
+        return '/people/{}-{}-{}'.format(first.lower(), last.lower(), number)
+
+    ## Output: html of the global directory listing the lawyers for letter
+    def directory_page(self, letter):
+        rows = []
+        for path in self.links(letter):
+            number = int(path.rsplit('-', 1)[1])
+            first, last = self._name(number)
+            rows.append('<tr><td><a href="{}">{}, {}</a></td><td><a href="/offices/{}">office</a></td></tr>'.format(
+                path, last, first, number % len(OFFICES)))
+        letters = ''.join('<a href="/GlobalDirectory/{0}">{0}</a> '.format(letter)
+                          for letter in string.ascii_uppercase)
+        return ('<html><head><title>Global Directory | Latham &amp; Watkins</title></head><body>'
+                '<div class="letters">{}</div><div><span><a>View All</a></span></div>'
+                '<table id="PeopleList">{}</table></body></html>').format(letters, ''.join(rows))
+
+    ## Output: html of lawyer number's webpage
+    def profile_page(self, number):
+        rng = random.Random(self.seed * 1000003 + number)
+        first, last = self._name(number)
+        name = '{} {}'.format(first, last)
+
+        def items(choices, low, high):
+            return rng.sample(choices, rng.randint(low, min(high, len(choices))))
+
+        def ul(values):
+            return '<ul>{}</ul>'.format(''.join('<li>{}</li>'.format(value) for value in values))
+
+        meta = [('Bar Qualification', ul('<span>{}</span>'.format(escape(bar)) for bar in items(BARS, 1, 3))),
+                ('Education', ul('{}, {}, {}'.format(degree, escape(school), rng.randint(1975, 2015))
+                                 for degree, school in zip(['JD', 'BA', 'LLM', 'MBA'], items(SCHOOLS, 1, 3)))),
+                ('Practices', ul('<a href="/practices/{}">{}</a>'.format(index, escape(practice))
+                                 for index, practice in enumerate(items(PRACTICES, 1, 4)))),
+                ('Industries', ul('<a href="/industries/{}">{}</a>'.format(index, escape(industry))
+                                  for index, industry in enumerate(items(INDUSTRIES, 0, 3))))]
+        biography = ''.join('<p>{} advises clients on {} matters, including {}.</p>'.format(
+            name, escape(rng.choice(PRACTICES)).lower(), escape(rng.choice(INDUSTRIES)).lower())
+            for _ in range(rng.randint(1, 6)))
+        experience = ''.join('<li>Advised Client {} on a {} transaction</li>'.format(
+            rng.randint(1, 9999), escape(rng.choice(PRACTICES)).lower()) for _ in range(rng.randint(0, 12)))
+        sections = ''.join('<li id="{}"><a>{}</a>{}</li>'.format(
+            SECTION_ID.format(section), escape(title),
+            ul(['{} item {}'.format(escape(title), item) for item in range(rng.randint(1, 5))] + ['more']))
+            for section, title in SECTIONS if rng.random() < 0.7)
+
+        return ('<html><head><title>{name} | Latham &amp; Watkins</title></head><body>'
+                '<div id="Navigation">{nav}</div>'
+                '<div id="RightColumnMainContent">'
+                '<img class="bioPhoto" src="/people/images/{slug}.jpg"/>'
+                '<h1 id="ContentPlaceHolder1_HeadingPlaceHolder_NameLabel">{name}</h1>'
+                '<span id="ContentPlaceHolder1_HeadingPlaceHolder_TitleLabel">{title}</span>'
+                '<span id="ContentPlaceHolder1_HeadingPlaceHolder_OfficesLabel">{office}</span>'
+                '<span id="PhoneNumberLabel">+1.212.906.{phone:04d}</span>'
+                '<a id="ContentPlaceHolder1_HeadingPlaceHolder_EmailLink" href="mailto:{email}">{email}</a>'
+                '<ul id="AttorneyMetaData">{meta}</ul>'
+                '<div id="ExpertiseContentArea">{biography}</div>'
+                '<div id="ExperienceContentArea"><ul>{experience}</ul></div>'
+                '</div><ul id="AdditionalInfo">{sections}</ul>{padding}</body></html>').format(
+            name=escape(name), nav=''.join('<a href="/practices/{}">{}</a>'.format(index, escape(practice))
+                                           for index, practice in enumerate(PRACTICES)),
+            slug=self._path(number)[len('/people/'):], title=rng.choice(TITLES), office=escape(rng.choice(OFFICES)),
+            phone=number % 10000, email='{}.{}@lw.com'.format(first.lower(), last.lower()),
+            meta=''.join('<li><div>{}</div>{}</li>'.format(heading, values) for heading, values in meta),
+            biography=biography, experience=experience, sections=sections, padding=self.padding)
+
+    ## Output: picture (a PNG of one colour) of the lawyer whose webpage has the bioPhoto path, None if there is no
+    ## such lawyer
+    def picture(self, path):
+        slug = path.split('?')[0][len('/people/images/'):]
+        if not path.startswith('/people/images/') or not slug.endswith('.jpg'):
+            return None
+        try:
+            number = int(slug[:-len('.jpg')].rsplit('-', 1)[1])
+        except (IndexError, ValueError):
+            return None
+        if not 0 <= number < self.profiles or self._path(number) != '/people/' + slug[:-len('.jpg')]:
+            return None
+        rng = random.Random(self.seed * 1000003 + number)
+        return _png(240, 300, bytes(rng.randrange(256) for _ in range(3)))
+
+    ## Output: (status, html) for the request path
+    def page(self, path):
+        parts = path.split('?')[0].rstrip('/').split('/')
+        if len(parts) == 3 and parts[1] == 'GlobalDirectory' and parts[2] in string.ascii_uppercase:
+            return 200, self.directory_page(parts[2])
+        if len(parts) == 2 and parts[1] == 'GlobalDirectory':
+            return 200, self.directory_page('A')
+        if len(parts) == 3 and parts[1] == 'people':
+            try:
+                number = int(parts[2].rsplit('-', 1)[1])
+            except (IndexError, ValueError):
+                number = -1
+            if 0 <= number < self.profiles and self._path(number) == '/'.join(parts):
+                return 200, self.profile_page(number)
+        return 404, '<html><body>Page not found</body></html>'
+
+    def _wait(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## request handler class serving site's pages over keep-alive http/1.1, with an ETag per page
+def _handler(site):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        ## headers and body go out as separate writes, which Nagle's algorithm would hold back on a keep-alive
+        ## connection until the client acks
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            with site._lock:
+                site.requests += 1
+            site._wait()
+
+            picture = site.picture(self.path)
+            if picture is not None:
+                status, body, content_type = 200, picture, 'image/png'
+            else:
+                status, html = site.page(self.path)
+                body, content_type = html.encode('utf-8'), 'text/html; charset=utf-8'
+            etag = '"{}-{:08x}"'.format(site.seed, zlib.crc32(self.path.encode('utf-8')))
+            if status == 200 and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            if status == 200:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+## Output: PNG image of width x height pixels, all of colour rgb (3 bytes)
+def _png(width, height, rgb):
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    rows = b''.join(b'\x00' + rgb * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+#######################################################################################################################
+
+
+#######################################################################################################################
+## serves the directory at http://127.0.0.1:PORT until Ctrl-C, e.g. for sites/example.json
+def main():
+    parser = argparse.ArgumentParser(description="Serves a synthetic lawyer directory on this machine.")
+    parser.add_argument('--profiles', type=int, default=1000, help="lawyers in the directory (default: 1000)")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds every request waits (default: 0.02)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many seconds more (default: 0)")
+    parser.add_argument('--port', type=int, default=8765, help="port to listen on (default: 8765)")
+    args = parser.parse_args()
+
+    with FakeDirectory(args.profiles, latency=args.latency, jitter=args.jitter, port=args.port) as site:
+        print('Serving {} lawyers at {}/GlobalDirectory (Ctrl-C to stop)'.format(args.profiles, site.url))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+#######################################################################################################################
+
+
+#######################################################################################################################
+if __name__ == '__main__':
+    main()
@@ -28,49 +28,304 @@ Chrome -
 
 import os
 import sys
+import time
+import multiprocessing
+import concurrent.futures
+import contextlib
+import itertools
+import argparse
 import requests
 import string
 import pprint
-import datetime
 import json
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 from selenium.webdriver.support.select import Select
+
+import lw_fetch
+import lw_profile
+import lw_sinks
+import lw_state
+import lw_cache
+import lw_checkpoint
+import lw_pipeline
+import lw_metrics
+import lw_search
+import lw_images
 #######################################################################################################################
 #######################################################################################################################
 
 def main():
-    ## opens chrome in background
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--window-size=1920x1080")
-
-    ## opens website
-    driver = webdriver.Chrome(chrome_options=chrome_options)
-    driver.get("https://www.lw.com/GlobalDirectory")
-    print(driver.title)
-
-    ## gets list of lawyers links
-    lawyers = getLawyers(driver)
+    ## command line options
+    parser = argparse.ArgumentParser(description="Scrapes the Latham & Watkins global directory.")
+    parser.add_argument('--backend', choices=['http', 'driver'], default='http',
+                        help="fetch lawyer pages with plain http requests (falling back to chrome when a page "
+                             "does not render) or always with headless chrome (default: http)")
+    parser.add_argument('--parser', choices=['html.parser', 'lxml'], default='html.parser',
+                        help="BeautifulSoup parser for lawyer pages, lxml is faster if installed "
+                             "(default: html.parser)")
+    parser.add_argument('--letters', default='Q',
+                        help="first letters of the last names to scrape, e.g. ABC, or 'all' (default: Q)")
+    parser.add_argument('--discovery-workers', type=int, default=1,
+                        help="number of letters listed at the same time, each in its own chrome (default: 1)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of lawyer pages fetched at the same time (default: 1)")
+    parser.add_argument('--parse-workers', type=int, default=1,
+                        help="number of lawyer pages parsed at the same time (default: 1)")
+    parser.add_argument('--parse-processes', type=int, default=0,
+                        help="parse lawyer pages in this many worker processes, to use more than one core and keep "
+                             "parsing off the fetching threads. 0 parses in this process (default: 0)")
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help="most pages waiting between two stages of the crawl: fetching stops when parsing "
+                             "or writing falls this far behind (default: 16)")
+    parser.add_argument('--max-per-host', type=int, default=4,
+                        help="most requests in flight to www.lw.com at once. The crawl speeds up towards it while "
+                             "the website keeps up and backs off when it struggles (default: 4)")
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help="least seconds between the start of two requests to www.lw.com (default: 0)")
+    parser.add_argument('--db', metavar='PATH',
+                        help="also load the lawyers straight into this SQLite database file")
+    parser.add_argument('--schema', choices=['wide', 'normalized'], default='wide',
+                        help="layout of the sql file and the database: one wide table, or a table of TEXT columns "
+                             "keyed on WebpageURL with a child table per multi-valued field and indexes on name, "
+                             "office and practice (default: wide)")
+    parser.add_argument('--commit-size', type=int, default=500,
+                        help="rows inserted and committed per database transaction (default: 500)")
+    parser.add_argument('--rows-per-insert', type=int, default=100,
+                        help="rows per multi-row INSERT statement in the sql file (default: 100)")
+    parser.add_argument('--parquet', metavar='DIR',
+                        help="also write the lawyers as Parquet part files in this folder, for analytics "
+                             "(needs pyarrow). Every run writes all the lawyers again, so it can't be used with "
+                             "--incremental")
+    parser.add_argument('--parquet-compression', choices=lw_sinks.COMPRESSIONS, default='zstd',
+                        help="compression of the Parquet files (default: zstd)")
+    parser.add_argument('--row-group-size', type=int, default=10000,
+                        help="rows per Parquet row group (default: 10000)")
+    parser.add_argument('--row-groups-per-part', type=int, default=10,
+                        help="row groups per Parquet part file. Parts are only readable once finished, lawyers in an "
+                             "unfinished part are scraped again after a crash (default: 10)")
+    parser.add_argument('--search-index', metavar='PATH',
+                        help="also index the lawyers' biographies, experience and expertise for full-text search in "
+                             "this file, searched with lw_search.py (needs SQLite with FTS5)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only write lawyers that are new or changed since the last incremental run, upserting "
+                             "them on WebpageURL, and delete lawyers that left the directory")
+    parser.add_argument('--state', metavar='PATH', default='LW_State.db',
+                        help="where --incremental keeps what it knows about each page (default: LW_State.db)")
+    parser.add_argument('--cache', metavar='DIR',
+                        help="keep every fetched page in this folder and answer from it while it is fresh")
+    parser.add_argument('--cache-ttl', type=float, default=24,
+                        help="hours a cached page stays fresh before it is revalidated (default: 24)")
+    parser.add_argument('--cache-max-mb', type=float,
+                        help="evict least recently used pages once the cache is bigger than this")
+    parser.add_argument('--from-cache', action='store_true',
+                        help="replay a run from --cache (default: LW_Cache) without touching the website")
+    parser.add_argument('--images', metavar='DIR',
+                        help="also download the lawyers' pictures into this folder, named after their sha256, and "
+                             "record their ImagePath and ImageHash. Pictures already there are only downloaded "
+                             "again if they changed")
+    parser.add_argument('--thumbnail-size', type=int, default=lw_images.THUMBNAIL_SIZE,
+                        help="longest side in pixels of the thumbnails made of the pictures, 0 for none (needs "
+                             "Pillow, default: {})".format(lw_images.THUMBNAIL_SIZE))
+    parser.add_argument('--thumbnail-workers', type=int, default=2,
+                        help="number of thumbnails made at the same time (default: 2)")
+    parser.add_argument('--checkpoint', metavar='PATH', default='LW_Crawl.json',
+                        help="crawl progress is saved here and an interrupted run resumes from it "
+                             "(default: LW_Crawl.json)")
+    parser.add_argument('--retries', type=int, default=3,
+                        help="times a failed page or letter is retried in a run, with exponential backoff "
+                             "(default: 3)")
+    parser.add_argument('--max-attempts', type=int, default=8,
+                        help="a page or letter is given up on after failing this many times over all runs "
+                             "(default: 8)")
+    parser.add_argument('--report', metavar='PATH', default='LW_Report.json',
+                        help="where the run report (per-stage latency percentiles, pages/sec, bytes, retries, "
+                             "timeouts, peak memory) is written as JSON (default: LW_Report.json)")
+    parser.add_argument('--prometheus', metavar='PATH',
+                        help="also write the run report in the Prometheus text format to this file")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="profile the run with cProfile, all threads merged, and save the stats to this file")
+    args = parser.parse_args()
+    ## Parquet parts can't be updated in place: an incremental run would leave only the lawyers it wrote
+    if args.parquet and args.incremental:
+        parser.error("--parquet can't be used with --incremental, the folder would only keep the new and changed "
+                     "lawyers")
+
+    ## timings and counters of the run, and where the time goes if asked
+    metrics = lw_metrics.Metrics()
+    profiler = lw_metrics.Profiler() if args.profile else None
+
+    ## crawl progress, resumed if the last run didn't finish
+    frontier = lw_checkpoint.CrawlFrontier(args.checkpoint, max_attempts=args.max_attempts)
+    if frontier.resumed:
+        print('Resuming crawl from ' + args.checkpoint + ': ' + str(len(frontier.completed)) + ' lawyers done.')
+
+    ## page cache, required when replaying
+    cache = None
+    if args.cache or args.from_cache:
+        cache = lw_cache.PageCache(args.cache or 'LW_Cache', ttl=args.cache_ttl * 3600,
+                                   max_bytes=args.cache_max_mb * 1024 * 1024 if args.cache_max_mb else None)
+
+    ## downloaded pictures, kept between runs
+    images = None
+    if args.images:
+        images = lw_images.ImageStore(args.images, thumbnail_size=args.thumbnail_size,
+                                      thumbnail_workers=args.thumbnail_workers, metrics=metrics)
+
+    if args.from_cache:
+        driver = None
+    else:
+        ## opens chrome in background and opens website
+        driver = lw_fetch.headless_chrome()
+        driver.get(lw_profile.DIRECTORY)
+        print(driver.title)
+
+    ## keeps the requests to www.lw.com as fast as the website sustains, for the directory and the lawyer pages
+    limiter = lw_fetch.AdaptiveLimiter(max_per_host=args.max_per_host, min_interval=args.delay, metrics=metrics)
+
+    ## lists the lawyers links, a letter at a time. Lawyer pages are fetched as soon as their letter is listed
+    listed_letters = {}
+    letters = string.ascii_uppercase if args.letters.lower() == 'all' else args.letters.upper()
+    found = [0]
+
+    def lawyers():
+        for lawyer in iter_lawyers(driver, cache=cache, replay=args.from_cache, frontier=frontier,
+                                   retries=args.retries, listed=listed_letters, letters=letters,
+                                   workers=args.discovery_workers, limiter=limiter, metrics=metrics,
+                                   profiler=profiler):
+            found[0] += 1
+            yield lawyer
+
+    ## gets lawyers and their information one at a time and writes each of them to the json lines file, the
+    ## sql file and the database as soon as it is scraped
+
+    ## incremental runs only get new and changed lawyers and upsert them on WebpageURL. So does a resumed run: the
+    ## lawyers the crashed run wrote after its last checkpoint are scraped and written again. --db always upserts, it
+    ## keeps the lawyers of earlier runs
+    state = lw_state.StateStore(args.state) if args.incremental else None
+    upsert_key = lw_sinks.KEY if args.incremental or frontier.resumed else None
+
+    ## driver is busy listing the directory meanwhile, so pages that need a browser get their own
+    lawyers_info = iter_lawyers_info(None, lawyers(), workers=args.workers, limiter=limiter,
+                                     backend=args.backend, parser=args.parser, state=state, cache=cache,
+                                     replay=args.from_cache, frontier=frontier, retries=args.retries,
+                                     parse_workers=args.parse_workers, parse_processes=args.parse_processes,
+                                     queue_size=args.queue_size, images=images, metrics=metrics,
+                                     profiler=profiler)
+
+    ## a resumed run adds to the files of the run it picks up from, the json lines file cut back to the lawyers
+    ## checkpointed as written
+    sinks = [lw_sinks.JsonLinesSink('LW_Lawyers.jsonl', append=frontier.resumed, keep=frontier.completed)]
+    ## the normalized schema always upserts on WebpageURL, its primary key
+    if args.schema == 'normalized':
+        sinks.append(lw_sinks.NormalizedSqlFileSink('LW_Lawyers.sql', rows_per_insert=args.rows_per_insert,
+                                                    append=frontier.resumed))
+        if args.db:
+            sinks.append(lw_sinks.NormalizedDatabaseSink(lw_sinks.SqliteAdapter(args.db),
+                                                         commit_size=args.commit_size))
+    else:
+        sinks.append(lw_sinks.SqlFileSink('LW_Lawyers.sql', rows_per_insert=args.rows_per_insert,
+                                          upsert_key=upsert_key, append=frontier.resumed))
+        if args.db:
+            sinks.append(lw_sinks.DatabaseSink(lw_sinks.SqliteAdapter(args.db), commit_size=args.commit_size,
+                                               upsert_key=lw_sinks.KEY))
+    if args.search_index:
+        sinks.append(lw_search.SearchIndexSink(args.search_index, commit_size=args.commit_size))
+    if args.parquet:
+        sinks.append(lw_sinks.ParquetSink(args.parquet, row_group_size=args.row_group_size,
+                                          row_groups_per_part=args.row_groups_per_part,
+                                          compression=args.parquet_compression, append=frontier.resumed))
+    ## saves the progress once the sinks have flushed the lawyers written: they are marked done in the checkpoint,
+    ## and what the incremental state recorded about them is committed along with it. The last pending of them
+    ## aren't safely stored by every sink yet (e.g. in an unfinished Parquet part) and are left for a later checkpoint.
+    ## Output: links of the lawyers left
+    def checkpoint(written, pending=0):
+        held = written[len(written) - pending:] if pending else []
+        frontier.done(*written[:len(written) - len(held)])
+        frontier.save()
+        if state is not None:
+            state.commit(hold=held)
+        return held
+
+    ## the main thread only writes, it is profiled along with the worker threads
+    profiling = profiler.running() if profiler is not None else contextlib.nullcontext()
+    ## lawyers written since the last checkpoint. They are marked done once the sinks have stored them. If anything
+    ## goes wrong, a sink may have lost them: only what was checkpointed before is kept (with the letters listed and
+    ## the failures so far) and the next run resumes from there
+    written = []
+    try:
+        with lw_sinks.Tee(sinks) as sink, profiling:
+            for lawyer_info in lawyers_info:
+                with metrics.timer('write'):
+                    sink.write(lawyer_info)
+                metrics.count('records')
+                written.append(lawyer_info['WebpageURL'])
+                if frontier.due():
+                    with metrics.timer('flush'):
+                        sink.flush()
+                    written = checkpoint(written, sink.pending())
+
+            ## lawyers known from earlier runs that are no longer in the directory. Only known for the letters that
+            ## were listed in full this time
+            if state is not None:
+                sink.remove(state.finish(dict((letter, [lw_profile.DOMAIN + link for link in links])
+                                              for letter, links in listed_letters.items())))
+    except BaseException:
+        frontier.save()
+        raise
+    ## the sinks are closed by now, so every lawyer written is stored
+    checkpoint(written)
+
     print()
-    print('Latham & Watkins has '+ str(len(lawyers)) + ' lawyers under their books.')
+    print('Latham & Watkins has '+ str(found[0]) + ' lawyers under their books.')
     print()
 
-    ## gets lawyers and their information in a list of dictionaries
-    lawyers_dict = get_lawyers_info(driver, lawyers)
-    #print(lawyers_dict)
-    #pprint.pprint(lawyers_dict)
-
-    ## converts dictionary to json file
-    convert_to_json(lawyers_dict)
-
-    ## creates sql file and code to generate database
-    create_sql(lawyers_dict)
+    frontier.finish()
+    given_up = frontier.given_up()
+    if given_up:
+        print('Gave up on ' + str(len(given_up)) + ' pages/letters:')
+        for key, error in sorted(given_up.items()):
+            print('  ' + key + ': ' + error)
+
+    if state is not None:
+        print('New: {new}, changed: {changed}, unchanged: {unchanged}, removed: {removed}'.format(**state.counts))
+        state.close()
+
+    if cache is not None:
+        print(cache.summary())
+        cache.close()
+
+    if images is not None:
+        images.close()
+        print(images.summary())
+
+    print(limiter.summary())
+
+    ## run report, with the cache and incremental counts when there are any
+    parse_vs_fetch = metrics.compare('parse', 'fetch')
+    extra = {'options': vars(args), 'lawyers': found[0], 'given_up': len(given_up), 'hosts': limiter.stats(),
+             'parse_vs_fetch': parse_vs_fetch}
+    if cache is not None:
+        extra['cache'] = cache.stats
+    if state is not None:
+        extra['state'] = state.counts
+    if images is not None:
+        extra['images'] = images.stats
+    print(metrics.summary())
+    print('Parsing took {:.1f}s (p50 {:.1f} ms) in {}, fetching {:.1f}s (p50 {:.1f} ms){}'.format(
+        parse_vs_fetch['parse_seconds'], parse_vs_fetch['parse_p50'] * 1000,
+        '{} processes'.format(args.parse_processes) if args.parse_processes > 0 else 'this process',
+        parse_vs_fetch['fetch_seconds'], parse_vs_fetch['fetch_p50'] * 1000,
+        ', {:.0%} of it'.format(parse_vs_fetch['ratio']) if parse_vs_fetch['ratio'] is not None else ''))
+    metrics.write_json(args.report, **extra)
+    print('Run report written to ' + args.report)
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
+    if profiler is not None:
+        profiler.dump(args.profile)
+        print('Profile written to ' + args.profile + ' (python -m pstats ' + args.profile + ')')
 
     print('Check for JSON and SQL files in folder.')
 
@@ -84,390 +339,412 @@ def main():
 #######################################################################################################################
 
 ## function scrapes website to return a list of links for each lawyer in directory.
-## Input: selenium driver on Latham & Watkins global directory webpage
-## Output: list of lawyers links
-def getLawyers(driver):
-    ## wait time for browser
-    wait = WebDriverWait(driver, 5)
+## Input: see iter_lawyers
+## Output: list of lawyers links, in the order of letters and without duplicates
+def getLawyers(driver, **options):
+    return list(iter_lawyers(driver, **options))
+#######################################################################################################################
+
+
+#######################################################################################################################
 
+## generator yielding the link of each lawyer in directory, a letter at a time as soon as it is listed.
+## Input: selenium driver on Latham & Watkins global directory webpage. letters are the first letters of the last
+## names to list (default: only Q). workers > 1 lists that many letters at the same time, each worker with its own
+## headless chrome on the directory webpage. With a cache (lw_cache.PageCache) the list of lawyers for every letter
+## is saved to it, and with replay=True read back from it instead of clicking through the website (driver can then
+## be None).
+## A letter whose list doesn't load (timeout, stale element, intercepted click, ...) is retried up to retries
+## times, waiting longer each time, then skipped. With a frontier (lw_checkpoint.CrawlFrontier) letters done in an
+## earlier run aren't scraped again, and failures count towards the frontier's limit over all runs. Letters that were skipped are added to skipped, if given, and letters
+## listed in full go in listed ({letter: its lawyers links}), if given.
+## Listing each letter is timed in metrics (lw_metrics.Metrics) and, with a profiler (lw_metrics.Profiler), profiled.
+## limiter (lw_fetch.AdaptiveLimiter) paces the listing along with the lawyer pages and times its waits.
+## Output: lawyers links, in the order of letters and without duplicates
+def iter_lawyers(driver, cache=None, replay=False, frontier=None, retries=3, skipped=None, listed=None, letters=None,
+                 workers=1, limiter=None, metrics=None, profiler=None):
     ## using only Q for testing purposes
     #alphabets = list(string.ascii_uppercase)
-    alphabets = ['Q']
-
-    lawyers = []
-    for letter in alphabets:
-        #print(letter)
-        try:
-            ## waits and checks if page is properly open by checking if a specific link is clickable and then click it
-            elem = wait.until(EC.element_to_be_clickable(
-                (By.LINK_TEXT, letter)))
-            elem.click()
-
-            ## waits and checks if list view of lawyers is present and proceed to click list view button
-            list_view = wait.until(EC.presence_of_element_located(
-                (By.ID, "ContentPlaceHolder1_MainContentPlaceHolder_ListTab")))
-            list_view.click()
-
-            ## waits until list of lawyers is element is present
-            table_view = wait.until(EC.presence_of_element_located((By.ID, 'PeopleList')))
+    alphabets = list(dict.fromkeys(letters)) if letters else ['Q']
+
+    if metrics is None:
+        metrics = lw_metrics.Metrics()
+    if limiter is None:
+        limiter = lw_fetch.HostLimiter()
+
+    ## lists one letter, trying again if it fails.
+    ## Output: list of lawyers links for letter, or None if it was skipped
+    def list_letter(letter_driver, letter):
+        ## letter done by the run being resumed
+        done = frontier.letter_links(letter) if frontier is not None else None
+        if done is not None:
+            return done
+
+        key = 'letter:' + letter
+        for attempt in itertools.count(1):
+            if frontier is not None and frontier.gave_up(key):
+                print('Skipping letter ' + letter + ', it failed too many times')
+                return None
             try:
-                ## finds link element, a, that contains text 'All' by xpath and clicks it to display all laywers
-                ## whose last name starts with letter. If list is short and element not present, the process is skipped
-                view_all = driver.find_element_by_xpath("//div/span/a[contains(text(),'All')]")
-                view_all.click()
-            except NoSuchElementException:
-                pass
-
-            ## creates empty list to hold lawyer basic info
-            select_lawyer = []
-
-            ## parses page
-            soup = BeautifulSoup(driver.page_source, "html.parser")
-
-            ## finds table holding list/records of lawyers and appends lawyer basic info to select_laywer list
-            table = soup.findChild('table', {'id': 'PeopleList'})
-            if table is not None:
-                rows = table.findChildren('tr')
-                for row in rows:
-                    links = row.findChildren('a')
-                    for link in links:
-                        if link:
-                            select_lawyer.append(link['href'])
-            #print(select_lawyer)
-
-            ## each lawyer link has 'people' string in it, therefore only srings that match the criteria are added to
-            ## lawyers list. Links would be used to select each lawyer individually later on
-            for i in select_lawyer:
-                if 'people' in i:
-                    lawyers.append(i)
-
-            #print(lawyers)
-
-        # prints error if elements are not present
-        except TimeoutException as err:
-            print("Click Failed")
-            print(str(err))
-            return
+                ## after a failure, starts over from the directory page
+                if attempt > 1 and letter_driver is not None:
+                    letter_driver.get(lw_profile.DIRECTORY)
+                ## a replay doesn't go to the website, it needs no pacing
+                with metrics.timer('letter'), (limiter.slot(lw_profile.DIRECTORY, lw_fetch.LISTING) if not replay
+                                               else contextlib.nullcontext()):
+                    letter_lawyers = get_letter_lawyers(letter_driver, letter, cache=cache, replay=replay,
+                                                        limiter=limiter, metrics=metrics)
+                if letter_lawyers is not None and frontier is not None:
+                    frontier.letter_done(letter, letter_lawyers)
+                return letter_lawyers
+
+            # prints error if elements are not present, went stale or the click was intercepted after a postback.
+            # The next attempt starts over from the directory page
+            except WebDriverException as err:
+                print("Click Failed")
+                print(str(err))
+                if isinstance(err, TimeoutException):
+                    metrics.count('timeouts')
+                if frontier is not None:
+                    frontier.failed(key, err)
+                if attempt > retries:
+                    return None
+                metrics.count('retries')
+                time.sleep(lw_checkpoint.backoff_delay(attempt))
+
+    ## one browser per worker, each starting on the directory webpage. A single worker reuses driver
+    def make_driver():
+        if replay:
+            return None
+        if workers <= 1:
+            return driver
+        letter_driver = lw_fetch.headless_chrome()
+        letter_driver.get(lw_profile.DIRECTORY)
+        return letter_driver
+
+    def close_driver(letter_driver):
+        if letter_driver is not None and letter_driver is not driver:
+            letter_driver.quit()
+
+    ## merges the lists of all letters. The same lawyer can be listed more than once, they are only kept once
+    seen = set()
+    pool = lw_fetch.WorkerPool(make_driver, workers, close_resource=close_driver)
+    if profiler is not None:
+        list_letter = profiler.wrap(list_letter)
+    for letter, letter_lawyers in zip(alphabets, pool.imap(list_letter, alphabets)):
+        if letter_lawyers is None:
+            if skipped is not None:
+                skipped.append(letter)
+            continue
+        if listed is not None:
+            listed[letter] = letter_lawyers
+        for lawyer in letter_lawyers:
+            if lawyer not in seen:
+                seen.add(lawyer)
+                yield lawyer
 
     ## to check if right page was opened
     #driver.get_screenshot_as_file("capture.png")
-
-    ## returns list of lawyers links
-    return lawyers
 #######################################################################################################################
 
 
 #######################################################################################################################
 
-## function returns a list of dictionaries containing detailed information of each lawyer.
-## Input: selenium driver on webpage of last lastname letter in aplhabets list for the
-## Latham & Watkins global directory webpage. And list of links for each lawyer
-## Output: Lawyers and their detailed information in a list of dictionaries
-def get_lawyers_info(driver, lawyers):
-    ## placeholder for domain name of website
-    domain = 'https://www.lw.com'
-    wait = WebDriverWait(driver, 5)
-
-    ## list to hold dictionaries of each lawyer
-    lawyers_dict = []
-
-
-    for lawyer in lawyers:
-        ## lawyer link to be requested
-        lawyer = domain + lawyer
-        driver.get(lawyer)
-
+## function scrapes the list of lawyers whose last name starts with letter.
+## Input: selenium driver on Latham & Watkins global directory webpage and the letter. With a cache and replay, see
+## getLawyers. The clicks and the parse are timed in metrics, if given. The waits for each element are 5 seconds,
+## longer if the listings measured by limiter, if given, take longer
+## Output: list of lawyers links, None if replaying and the list isn't cached. Raises TimeoutException if the
+## list doesn't load
+def get_letter_lawyers(driver, letter, cache=None, replay=False, limiter=None, metrics=None):
+    if metrics is None:
+        metrics = lw_metrics.Metrics()
+    if limiter is None:
+        limiter = lw_fetch.HostLimiter()
+
+    ## the list for each letter is cached under the directory link
+    list_page = lw_profile.DIRECTORY + '#' + letter
+    if replay:
+        page = cache.get(list_page, allow_stale=True)
+        if page is None:
+            print('No cached list of lawyers for ' + letter)
+            return None
+        html = page.html
+
+    else:
+        ## wait time for browser: 5 seconds, or longer if listings have been taking long
+        wait = WebDriverWait(driver, max(5, limiter.timeout(list_page, 5, lw_fetch.LISTING)),
+                             poll_frequency=limiter.poll_interval(list_page, lw_fetch.LISTING))
+        start = time.monotonic()
+
+        ## waits and checks if page is properly open by checking if a specific link is clickable and then click it
+        elem = wait.until(EC.element_to_be_clickable(
+            (By.LINK_TEXT, letter)))
+        elem.click()
+
+        ## waits and checks if list view of lawyers is present and proceed to click list view button
+        list_view = wait.until(EC.presence_of_element_located(
+            (By.ID, "ContentPlaceHolder1_MainContentPlaceHolder_ListTab")))
+        list_view.click()
+
+        ## waits until list of lawyers is element is present
+        table_view = wait.until(EC.presence_of_element_located((By.ID, 'PeopleList')))
         try:
-            ## waits until RightColumnMainContent element is available, where basic information of the lawyer exists
-            elem = wait.until(EC.presence_of_element_located(
-                (By.ID,"RightColumnMainContent")))
-
-            ## parses page and scrapes data from the page if available. some data will be defaulted as None(NULL),
-            ## some will be permenantly set as None as website doesn't have that information.
-            soup = BeautifulSoup(driver.page_source, "html.parser")
-            content = soup.findChild('div', {'id': 'RightColumnMainContent'})
-
-            if content is not None:
-                name = (content.find('h1', {'id': 'ContentPlaceHolder1_HeadingPlaceHolder_NameLabel'})
-                        ).get_text(strip=True)
-
-                title = (content.find('span', {'id': 'ContentPlaceHolder1_HeadingPlaceHolder_TitleLabel'})
-                         ).get_text(strip=True)
-
-                location = (content.find('span', {'id': 'ContentPlaceHolder1_HeadingPlaceHolder_OfficesLabel'})
-                            ).get_text(strip=True)
-
-                company = 'Latham & Watkins'
-
-
-
-                phone = None
-                try:
-                    phone = (content.find('span', {'id': 'PhoneNumberLabel'})).get_text(strip=True)
-                except AttributeError:
-                    pass
-
-
-                email = None
-                try:
-                    email = (content.find('a', {'id': 'ContentPlaceHolder1_HeadingPlaceHolder_EmailLink'})
-                             ).get_text(strip=True)
-
-                except AttributeError:
-                    pass
-
-
-                linkedIn = None
-                cv = None
-
-
-                ## scrapes different section of webpage for educational background of lawyer and joins them with
-                ## a semicolon
-                edu = []
-                lawyer_meta = soup.findChild('ul', {'id': 'AttorneyMetaData'})
-                edu_ul = lawyer_meta.select('div')[1].find_next_siblings('ul')[0]
-                edu_li = edu_ul.findChildren('li')
-
-                for uni in edu_li:
-                    edu.append(uni.contents[0])
-                edu = "; ".join(edu)
-
-
-                ## Scrapes biography and experience information on lawyer and ensures proper character encoding.
-                bio = None
-                try:
-                    bio_area = soup.findChild('div', {'id': 'ExpertiseContentArea'})
-                    bio_p = bio_area.findChildren(['p', 'li'])
-                    bio = ''
-
-                    for i in bio_p:
-                        bio = bio + ' ' + i.get_text(" ", strip=True)
-                    bio = bio.replace("  ", " ")
-                    bio = (bio.encode('ascii','ignore')).decode("utf-8")
-
-                except AttributeError:
-                    pass
-
-
-
-                xp = None
-                try:
-                    find_xp = driver.find_element_by_link_text("ExperienceContentArea")
-                    xp_area = soup.findChild('div', {'id': 'ExperienceContentArea'})
-                    xp_p = xp_area.findChildren(['p', 'li', 'br'])
-                    xp = ''
-
-                    for i in xp_p:
-                        xp = xp + ' ' + i.get_text(" ", strip=True)
-                    xp = xp.replace("  ", " ")
-                    xp = (xp.encode('ascii', 'ignore')).decode("utf-8")
-
-                except NoSuchElementException:
-                    pass
-
-
-
-                ## Scrapes and merges Pracrices & Industries list from lawyer_meta (AttorneyMetaData list element)
-                xpts = None
-                try:
-                    pracs_ul = lawyer_meta.select('div')[2].find_next_siblings('ul')[0]
-                    pracs_li = pracs_ul.findChildren('li')
-                    xpts = []
-
-                    for prac in pracs_li:
-                        xpts.append((prac.contents[0].get_text(" ", strip=True
-                                                               ).encode('ascii', 'ignore')).decode("utf-8"))
-
-                    try:
-                        inds_ul = lawyer_meta.select('div')[3].find_next_siblings('ul')[0]
-                        inds_li = inds_ul.findChildren('li')
-
-                        for ind in inds_li:
-                            xpts.append((ind.contents[0].get_text(" ", strip=True
-                                                                  ).encode('ascii', 'ignore')).decode("utf-8"))
-
-                    except IndexError:
-                        pass
-
-                    xpts = "; ".join(xpts)
-
-                except IndexError:
-                    pass
-
-
-
-                ## Scrapes and gets bar qualifications for each lawyer if listed
-                barQ = []
-                try:
-                    bar_ul = lawyer_meta.select('div')[0].find_next_siblings('ul')[0]
-                    bar_li = bar_ul.findChildren('li')
-
-                    for bar in bar_li:
-                        barQ.append(bar.contents[0].get_text(" ", strip=True))
-
-                except IndexError:
-                    pass
-
-                barQ = "; ".join(barQ)
-
+            ## finds link element, a, that contains text 'All' by xpath and clicks it to display all laywers
+            ## whose last name starts with letter. If list is short and element not present, the process is skipped
+            view_all = driver.find_element_by_xpath("//div/span/a[contains(text(),'All')]")
+            view_all.click()
+        except NoSuchElementException:
+            pass
+        metrics.observe('letter.clicks', time.monotonic() - start)
+
+        html = driver.page_source
+        if cache is not None:
+            cache.put(lw_fetch.Page(list_page, html, None, None, False))
+
+    ## parses page
+    start = time.monotonic()
+    lawyers = lw_profile.parse_directory(html)
+    metrics.observe('letter.parse', time.monotonic() - start)
 
+    return lawyers
+#######################################################################################################################
 
-                mAffl = None
-
-
-
-                ## Scrape News and Events sections if available and joins them with a semicolon
-                newsEvents = None
-                try:
-                    find_events = driver.find_element_by_link_text("Events")
-                    events_area = soup.findChild('li', {'id': 'ContentPlaceHolder1_RightColumnNavigationPlaceHolder_'
-                                                'AdditionalInfoControl1_EventsSection_AdditionalInfoSectionWrapper'})
-
-                    events_li = events_area.findChild('ul').findChildren('li')
-                    Events = []
-
-                    for event in events_li:
-                        if event.get_text(" ", strip=True) != 'more':
-                            Events.append(event.get_text(" ", strip=True))
-
-                    newsEvents = Events
 
-                except NoSuchElementException:
-                    pass
-                except AttributeError:
-                    pass
+#######################################################################################################################
 
-                try:
-                    find_news = driver.find_element_by_link_text("News")
-                    news_area = soup.findChild('li', {'id': 'ContentPlaceHolder1_RightColumnNavigationPlaceHolder_'
-                                                'AdditionalInfoControl1_NewsSection_AdditionalInfoSectionWrapper'})
+## function returns a list of lw_profile.Lawyer records containing detailed information of each lawyer.
+## Input: selenium driver on webpage of last lastname letter in aplhabets list for the
+## Latham & Watkins global directory webpage. And list of links for each lawyer.
+## Output: Lawyers and their detailed information in a list of lw_profile.Lawyer, in the same order as lawyers
+def get_lawyers_info(driver, lawyers, **options):
+    return list(iter_lawyers_info(driver, lawyers, **options))
+#######################################################################################################################
 
-                    news_li = news_area.findChild('ul').findChildren('li')
-                    News = []
 
-                    for news in news_li:
-                        if news.get_text(" ", strip=True) != 'more':
-                            News.append(news.get_text(" ", strip=True))
+#######################################################################################################################
 
-                    if newsEvents:
-                        newsEvents = newsEvents + News
+## generator yielding an lw_profile.Lawyer containing detailed information of each lawyer as soon as it is scraped.
+## Input: selenium driver on webpage of last lastname letter in aplhabets list for the
+## Latham & Watkins global directory webpage (None to start a browser only if one is needed). And links for each
+## lawyer, any iterable: a generator such as iter_lawyers is fetched from while it is still listing the directory.
+## The pages go through a lw_pipeline.Pipeline: workers threads fetch them, parse_workers threads parse them and at
+## most queue_size pages wait between two stages, so fetching runs ahead of parsing and writing but never too far.
+## parse_processes > 0 hands the html to a pool of that many worker processes instead, which parse on other cores
+## than the fetching threads; the parse stage then gets at least two threads per process to keep them all busy.
+## With images (lw_images.ImageStore) a last stage of workers threads downloads every scraped lawyer's picture over
+## the same connection pool as the pages, within the limiter, and fills in the lawyer's ImagePath and ImageHash.
+## When replaying, only pictures already in images are used.
+## workers > 1 visits the profiles concurrently, each worker thread with its own fetcher. limiter
+## (lw_fetch.AdaptiveLimiter, or the fixed lw_fetch.HostLimiter) keeps the number of simultaneous requests and their
+## spacing polite, and the adaptive one sets the fetchers' timeouts. A page the website throttles (429/503) is
+## retried once the limiter lets requests through again; it doesn't count as a failure of the page or towards
+## retries; it is only skipped after lw_fetch.THROTTLED_RETRIES throttled answers in a run.
+## backend 'http' downloads the pages with plain keep-alive http requests and only falls back to a browser for pages
+## missing RightColumnMainContent, backend 'driver' renders every page in headless chrome.
+## parser is the BeautifulSoup parser used on the pages, 'html.parser' or 'lxml'.
+## With a state (lw_state.StateStore) pages are requested conditionally and only lawyers whose page is new or
+## changed since the last run are parsed and yielded. Every page is recorded in state once it has been handled.
+## With a cache (lw_cache.PageCache) pages are answered from it while they are fresh and saved to it once fetched.
+## replay=True only reads pages from the cache, never from the website: lawyers that aren't cached are skipped.
+## A page that fails (timeout, http error, ...) is retried up to retries times, waiting longer each time, then
+## skipped; one bad page never stops the others. With a frontier (lw_checkpoint.CrawlFrontier) lawyers written out
+## by an earlier run are skipped and failures count towards the frontier's limit over all runs. Pages that don't
+## yield a lawyer are marked done in the frontier here, yielded lawyers are left for the caller to mark once written.
+## Every fetch and parse is timed in metrics (lw_metrics.Metrics), along with pages, bytes, retries and timeouts, and
+## with a profiler (lw_metrics.Profiler) profiled in the worker threads.
+## Output: Lawyers and their detailed information, one lw_profile.Lawyer at a time, in the same order as lawyers.
+def iter_lawyers_info(driver, lawyers, workers=1, limiter=None, backend='http', parser='html.parser', state=None,
+                      cache=None, replay=False, frontier=None, retries=3, parse_workers=1, parse_processes=0,
+                      queue_size=16, images=None, metrics=None, profiler=None):
+    ## placeholder for domain name of website
+    domain = lw_profile.DOMAIN
+
+    if limiter is None:
+        limiter = lw_fetch.HostLimiter()
+    if metrics is None:
+        metrics = lw_metrics.Metrics()
+
+    ## one fetcher per worker thread. The http session and its connection pool are shared by all of them.
+    ## A single worker reuses driver instead of starting another browser. Only requests that go to the website wait
+    ## for the limiter: pages from the cache, and a replay, don't
+    session = lw_fetch.http_session(pool_size=max(workers, 1)) if backend == 'http' and not replay else None
+    ## pictures come over the pages' connection pool, or a pool of their own when pages are rendered in chrome
+    image_session = None
+    if images is not None and not replay:
+        image_session = session if session is not None else lw_fetch.http_session(pool_size=max(workers, 1))
+
+    def make_fetcher():
+        if replay:
+            return lw_cache.CachingFetcher(None, cache, offline=True)
+
+        fetcher = lw_fetch.DriverFetcher(driver if workers <= 1 else None, metrics=metrics, limiter=limiter)
+        if session is not None:
+            fetcher = lw_fetch.HttpFetcher(session, fallback=fetcher, metrics=metrics, limiter=limiter)
+        fetcher = lw_fetch.LimitedFetcher(fetcher, limiter)
+        if cache is not None:
+            fetcher = lw_cache.CachingFetcher(fetcher, cache)
+        return fetcher
+
+    ## requests lawyer page, trying again if it fails. Throttled answers don't count as failed attempts, only up to
+    ## lw_fetch.THROTTLED_RETRIES of them are retried.
+    ## Output: (lawyer link, lw_state.Known for the page from the last run or None, lw_fetch.Page). The page is None
+    ## when it couldn't be fetched.
+    def fetch(fetcher, lawyer):
+        known = state.get(lawyer) if state is not None else None
+        attempt = 1
+        throttled = 0
+        while True:
+            try:
+                with metrics.timer('fetch'):
+                    if known is None:
+                        page = fetcher.fetch_page(lawyer)
                     else:
-                        newsEvents = News
-
-                    newsEvents = "; ".join(newsEvents)
-
-                except NoSuchElementException:
-                    pass
-                except AttributeError:
-                    pass
-
-
-
-                ## Scrapes "Thought Leadership" section for publications of lawyer
-                publications = None
-                try:
-                    find_publications = driver.find_element_by_link_text("Thought Leadership")
-                    publications_area = soup.findChild('li', {'id': 'ContentPlaceHolder1_'
-                        'RightColumnNavigationPlaceHolder_AdditionalInfoControl1_ThoughtLeadershipSection_'
-                        'AdditionalInfoSectionWrapper'})
-
-                    publications_li = publications_area.findChild('ul').findChildren('li')
-                    publications = []
-
-                    for publication in publications_li:
-                        if publication.get_text(" ", strip=True) != 'more':
-                            publications.append(publication.get_text(" ", strip=True))
-
-                    publications = "; ".join(publications)
-
-                except NoSuchElementException:
-                    pass
-                except AttributeError:
-                    pass
-
-
-
-                clients = None
-
-
-                ## Scrapes "Awards & Rankings" section if availables
-                awards_rankings = None
-                try:
-                    find_AR = driver.find_element_by_link_text("Awards & Rankings")
-                    ARs_area = soup.findChild('li', {'id': 'ContentPlaceHolder1_RightColumnNavigationPlaceHolder_'
-                                        'AdditionalInfoControl1_AwardsRankingsSection_AdditionalInfoSectionWrapper'})
-
-                    ARs_li = ARs_area.findChild('ul').findChildren('li')
-                    awards_rankings = []
-
-                    for AR in ARs_li:
-                        if AR.get_text(" ", strip=True) != 'more':
-                            awards_rankings.append(AR.get_text(" ", strip=True))
-
-                    awards_rankings = "; ".join(awards_rankings)
-
-                except NoSuchElementException:
-                    pass
-                except AttributeError:
-                    pass
-
-
-
-                priorAssc = None
-
-
-                ## Scrapes page for picture of lawyer and creates link to view image if available
-                lawyer_pic = None
-                try:
-                    find_pic = driver.find_element_by_class_name("bioPhoto")
-                    bio_pic = soup.find('img', {'class': 'bioPhoto'})
-
-                    lawyer_pic = domain + bio_pic['src']
-
-                except NoSuchElementException:
-                    pass
-                except AttributeError:
-                    pass
-
-
-                ## Get time in YYYY-Mon-DD format
-                now = datetime.datetime.today()
-                now = now.strftime("%Y-%b-%d")
-
-
-                ## Creates dictionary with each lawyer info and appends it to lawyer_dict list
-                lawyers_dict.append({
-                    'Name': name,
-                    'Title': title,
-                    'Location': location,
-                    'Company': company,
-                    'Phone': phone,
-                    'Email': email,
-                    'LinkedIn': linkedIn,
-                    'CV': cv,
-                    'Education': edu,
-                    'Biography': bio,
-                    'Experience': xp,
-                    'Expertise': xpts,
-                    'AdmissionsQualifications': barQ,
-                    'MembershipsAffiliations': mAffl,
-                    'NewsEvents': newsEvents,
-                    'Publications': publications,
-                    'Clients': clients,
-                    'Distinctions': awards_rankings,
-                    'PriorAssociations': priorAssc,
-                    'Image': lawyer_pic,
-                    'WebpageURL': lawyer,
-                    'Timestamp': now,
-                    })
-
-        ## displays error if timeout occurs from driver waits
-        except TimeoutException as err:
-            print(str(err))
-            return
-
-    ## returns list of dictionaries containing lawyer information
-    return lawyers_dict
+                        page = fetcher.fetch_page(lawyer, known.etag, known.last_modified)
+                metrics.count('pages')
+                return lawyer, known, page
+            except lw_cache.CacheMiss:
+                print('Not in cache: ' + lawyer)
+                return lawyer, known, None
+            except lw_fetch.Throttled as err:
+                ## the limiter holds the retry back for as long as the website asked
+                print('Throttled on ' + lawyer + ': ' + str(err).strip())
+                throttled += 1
+                if throttled > lw_fetch.THROTTLED_RETRIES:
+                    metrics.count('failures')
+                    return lawyer, known, None
+                metrics.count('retries')
+            except Exception as err:
+                print('Failed to scrape ' + lawyer + ': ' + str(err).strip())
+                if frontier is not None:
+                    frontier.failed(lawyer, err)
+                if attempt > retries or (frontier is not None and frontier.gave_up(lawyer)):
+                    metrics.count('failures')
+                    return lawyer, known, None
+                metrics.count('retries')
+                time.sleep(lw_checkpoint.backoff_delay(attempt))
+                attempt += 1
+
+    ## scrapes a fetched lawyer page.
+    ## Output: (lawyer link, lw_state status, lw_state.Known for the page, Lawyer or None). The
+    ## status is None when the page wasn't scraped.
+    def parse(fetched):
+        lawyer, known, page = fetched
+        if page is None:
+            return lawyer, None, None, None
+        try:
+            return parse_page(lawyer, known, page)
+        except Exception as err:
+            ## the same html would fail again, so it isn't retried
+            print('Failed to scrape ' + lawyer + ': ' + str(err).strip())
+            metrics.count('failures')
+            if frontier is not None:
+                frontier.failed(lawyer, err)
+            return lawyer, None, None, None
+
+    def parse_page(lawyer, known, page):
+        if state is None:
+            return lawyer, None, None, parse_html(page.html, lawyer)[1]
+
+        if page.not_modified:
+            return lawyer, lw_state.UNCHANGED, known, None
+
+        page_hash, lawyer_info = parse_html(page.html, lawyer, known.content_hash if known else None, changed=True)
+        if page_hash is None:
+            status = None
+        elif known is None:
+            status = lw_state.NEW
+        elif lawyer_info is None:
+            status = lw_state.UNCHANGED
+        else:
+            status = lw_state.CHANGED
+        return lawyer, status, lw_state.Known(page_hash, page.etag, page.last_modified), lawyer_info
+
+    ## Output: (content hash of the page, Lawyer), see lw_profile.parse_timed. The parse time
+    ## is the one measured where the parsing ran; with processes, 'parse.wait' is the time a page spent going
+    ## to a process, waiting for one and coming back
+    def parse_html(html, lawyer, known_hash=None, changed=False):
+        if pool is None:
+            page_hash, lawyer_info, seconds = lw_profile.parse_timed(html, lawyer, known_hash, changed,
+                                                                     domain=domain, parser=parser)
+        else:
+            with metrics.timer('parse.wait'):
+                page_hash, lawyer_info, seconds = pool.submit(lw_profile.parse_timed, html, lawyer, known_hash,
+                                                              changed, domain=domain, parser=parser).result()
+        metrics.observe('parse', seconds)
+        return page_hash, lawyer_info
+
+    ## downloads the picture of a scraped lawyer into images and records where it is stored. A picture that can't
+    ## be downloaded leaves ImagePath and ImageHash empty; the lawyer is still written
+    def harvest(parsed):
+        lawyer_info = parsed[3]
+        image = lawyer_info.get('Image') if lawyer_info is not None else None
+        if not image:
+            return parsed
+        try:
+            if replay:
+                stored = images.lookup(image)
+            else:
+                with limiter.slot(image, lw_fetch.IMAGE):
+                    stored = images.download(image_session, image)
+        except Exception as err:
+            print('Failed to download picture ' + image + ': ' + str(err).strip())
+            stored = None
+        if stored is not None:
+            lawyer_info['ImagePath'], lawyer_info['ImageHash'] = stored.path, stored.digest
+        return parsed
+
+    ## lawyer links to be requested, generated as the workers get to them. Lawyers done by the run being resumed
+    ## and lawyers given up on are left out. They still count as seen, so state doesn't take them as removed
+    def links():
+        for lawyer in lawyers:
+            lawyer = domain + lawyer
+            if frontier is not None and (frontier.is_done(lawyer) or frontier.gave_up(lawyer)):
+                if state is not None:
+                    state.keep(lawyer)
+                continue
+            yield lawyer
+
+    ## the profiler only sees the parse threads of this process, not the parsing in worker processes
+    if profiler is not None:
+        fetch = profiler.wrap(fetch)
+        parse = profiler.wrap(parse)
+        harvest = profiler.wrap(harvest)
+
+    ## worker processes are spawned rather than forked: forking a process with threads running can deadlock them
+    pool = None
+    if parse_processes > 0:
+        pool = concurrent.futures.ProcessPoolExecutor(parse_processes,
+                                                      mp_context=multiprocessing.get_context('spawn'))
+        parse_workers = max(parse_workers, 2 * parse_processes)
+
+    ## links are fetched as soon as they are listed, and parsed while the next pages are being fetched
+    stages = [lw_pipeline.Stage('fetch', fetch, workers, make_resource=make_fetcher,
+                                close_resource=lambda fetcher: fetcher.close()),
+              lw_pipeline.Stage('parse', parse, parse_workers)]
+    if images is not None:
+        stages.append(lw_pipeline.Stage('images', harvest, workers))
+    try:
+        for lawyer, status, known, lawyer_info in lw_pipeline.Pipeline(links(), stages, queue_size=queue_size):
+            ## recorded before the lawyer is handed on, so the caller's next checkpoint commits it along with the
+            ## lawyer, but only committed by the caller once it is written out (see lw_state.StateStore), so a crash
+            ## never loses a change. Pages that couldn't be scraped are kept as they were
+            if status is not None:
+                state.record(lawyer, status, known)
+            elif state is not None:
+                state.keep(lawyer)
+
+            if lawyer_info is not None:
+                yield lawyer_info
+            elif status is not None and frontier is not None:
+                frontier.done(lawyer)
+    finally:
+        if session is not None:
+            session.close()
+        if image_session is not None and image_session is not session:
+            image_session.close()
+        if pool is not None:
+            pool.shutdown()
 #######################################################################################################################
 
 
@@ -478,47 +755,44 @@ def get_lawyers_info(driver, lawyers):
 def convert_to_json(lawyers_dict):
     with open('LW_Lawyers.json', 'w') as outfile:
         ## indent = 4 ensure a prettier view of json file
-        json.dump(lawyers_dict, outfile, indent= 4)
+        json.dump([dict(row) for row in lawyers_dict], outfile, indent= 4)
 #######################################################################################################################
 
 
 #######################################################################################################################
 
-## creates sql code using lawyers_dict list of dictionaries.
+## creates Parquet files from lawyers_dict list of dictionaries, in the LW_Lawyers.parquet folder.
 ## Input: lawyers_dict list of dictionaries.
-def create_sql(lawyers_dict):
-    table_name = 'L_W_Directory'
+def convert_to_parquet(lawyers_dict, path='LW_Lawyers.parquet'):
+    with lw_sinks.ParquetSink(path) as parquet:
+        for row in lawyers_dict:
+            parquet.write(row)
+#######################################################################################################################
+
 
+#######################################################################################################################
+
+## creates sql code using lawyers_dict list of dictionaries.
+## Input: lawyers_dict list of dictionaries, normalized to use the normalized schema (lw_sinks.NormalizedSchema).
+def create_sql(lawyers_dict, normalized=False):
     ## creates Column names from keys in lawyers_dict list of dictionaries.
     columns = []
     for row in lawyers_dict:
         for key in row.keys():
             if key not in columns:
                 columns.append(key)
-    ##print(columns)
-
-    ## SQL create table string created dynamically using table_name and column names
-    create_table = ("""CREATE TABLE {} (
-  {}
-);
-
-""".format(table_name, (",\n  ".join(map(lambda x: "{} VARCHAR(2000)".format(x), columns))))
-        )
-
-    ## Creates SQL insert statements dynamically from each dictornary in lawyers_dict list.
-    ## Replaces single quote/apostrophe with two single quotes/apostrophe to prevent unwated escapes.
-    ## 'NULL' renders as NULL in SQL,
-    ins_statements = ''
-    for row in lawyers_dict:
-        ins_statements += ("""\nINSERT INTO {} VALUES({});""".format(table_name,
-            (",".join(map(lambda key: "'{}'".format(row[key].replace("'","''")) if row[key] is not None else "NULL", columns))))
-              )
 
-    with open('LW_Lawyers.sql', 'w') as sql_file:
-        sql_file.write(create_table)
-        sql_file.write(ins_statements)
+    ## SQL create table statement and insert statement for each dictionary in lawyers_dict list.
+    if normalized:
+        sql_file = lw_sinks.NormalizedSqlFileSink('LW_Lawyers.sql', lw_sinks.NormalizedSchema(columns=columns))
+    else:
+        sql_file = lw_sinks.SqlFileSink('LW_Lawyers.sql', columns=columns)
+    with sql_file:
+        for row in lawyers_dict:
+            sql_file.write(row)
 #######################################################################################################################
 
 
 #######################################################################################################################
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,247 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - on-disk page cache
+## Filename: lw_cache.py
+##
+## Description:
+##          Keeps every fetched page on disk so it can be parsed again
+##          without going back to the website. Page bodies are stored
+##          gzip'ed and named after the sha256 of their content, so the
+##          same page is only stored once; a small SQLite index maps each
+##          url to its body. Entries older than the TTL are revalidated and
+##          the least recently used ones are evicted once the cache grows
+##          past its size limit.
+##
+######################################################################################
+######################################################################################
+
+import os
+import gzip
+import time
+import sqlite3
+import hashlib
+import threading
+
+import lw_fetch
+#######################################################################################################################
+#######################################################################################################################
+
+
+## raised by an offline CachingFetcher for a page that isn't in the cache
+class CacheMiss(Exception):
+    pass
+
+
+## Page cache in directory path. ttl is how many seconds a page stays fresh (None: forever), max_bytes how big the
+## stored (compressed) pages may get before the least recently used are evicted (None: no limit). When pages were
+## last used is written to the index access_batch pages at a time, not on every hit. The size of the stored pages is
+## kept as a running total, so only a cache past max_bytes looks for pages to evict. Safe to use from several worker
+## threads.
+class PageCache(object):
+
+    def __init__(self, path, ttl=None, max_bytes=None, access_batch=500):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.access_batch = max(1, access_batch)
+        self.stats = dict.fromkeys(['hits', 'misses', 'stale', 'stores', 'evictions'], 0)
+        self._lock = threading.Lock()
+        ## url: time it was last read, not written to the index yet
+        self._accessed = {}
+
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(path, 'index.db'), check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS pages (
+  url TEXT PRIMARY KEY,
+  digest TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  etag TEXT,
+  last_modified TEXT,
+  fetched_at REAL NOT NULL,
+  accessed_at REAL NOT NULL
+)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest)")
+        self.connection.commit()
+        ## size of the stored bodies, each body counted once however many urls share it
+        self._bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM pages)").fetchone()[0]
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest + '.gz')
+
+    def _fresh(self, fetched_at):
+        return self.ttl is None or time.time() - fetched_at < self.ttl
+
+    ## Output: cached lw_fetch.Page of url, or None if it isn't cached. A page older than the ttl only comes back
+    ## with allow_stale (its validators can still be used to revalidate it)
+    def get(self, url, allow_stale=False):
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT digest, size, etag, last_modified, fetched_at FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+
+            digest, size, etag, last_modified, fetched_at = row
+            if not allow_stale and not self._fresh(fetched_at):
+                self.stats['stale'] += 1
+                return None
+
+            try:
+                with gzip.open(self._object_path(digest), 'rt', encoding='utf-8') as body:
+                    html = body.read()
+            except (OSError, EOFError):
+                ## body went missing or is corrupt, forget about it
+                self.connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+                self._drop_object(digest, size)
+                self.connection.commit()
+                self.stats['misses'] += 1
+                return None
+
+            self._accessed[url] = time.time()
+            if len(self._accessed) >= self.access_batch:
+                self._write_accessed()
+            self.stats['hits'] += 1
+            return lw_fetch.Page(url, html, etag, last_modified, False)
+
+    ## writes when the pages read since the last time were used, in one transaction. Must be called with _lock held
+    def _write_accessed(self):
+        if self._accessed:
+            self.connection.executemany("UPDATE pages SET accessed_at = ? WHERE url = ?",
+                                        [(accessed_at, url) for url, accessed_at in self._accessed.items()])
+            self.connection.commit()
+            self._accessed = {}
+
+    ## Output: (etag, last_modified) of url's cached page, even a stale one, or None if it isn't cached
+    def validators(self, url):
+        with self._lock:
+            return self.connection.execute("SELECT etag, last_modified FROM pages WHERE url = ?", (url,)).fetchone()
+
+    ## stores page (lw_fetch.Page) under its url
+    def put(self, page):
+        data = page.html.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(digest)
+
+        with self._lock:
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                ## written under a temporary name first so a crash never leaves a truncated body behind
+                temp_path = '{}.{}.tmp'.format(object_path, threading.get_ident())
+                with gzip.open(temp_path, 'wb') as body:
+                    body.write(data)
+                os.replace(temp_path, object_path)
+
+            old = self.connection.execute("SELECT digest, size FROM pages WHERE url = ?", (page.url,)).fetchone()
+            size = os.path.getsize(object_path)
+            if not self._referenced(digest):
+                self._bytes += size
+            self._accessed.pop(page.url, None)
+            now = time.time()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages (url, digest, size, etag, last_modified, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (page.url, digest, size, page.etag, page.last_modified, now, now))
+            if old is not None and old[0] != digest:
+                self._drop_object(*old)
+            self._evict()
+            self.connection.commit()
+            self.stats['stores'] += 1
+
+    ## marks url's cached page as fresh again, after the server said it was not modified
+    def touch(self, url):
+        with self._lock:
+            now = time.time()
+            self._accessed.pop(url, None)
+            self.connection.execute("UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+            self.connection.commit()
+
+    def _referenced(self, digest):
+        return self.connection.execute("SELECT 1 FROM pages WHERE digest = ? LIMIT 1", (digest,)).fetchone() is not None
+
+    ## deletes a body of size bytes once no url refers to it any more
+    def _drop_object(self, digest, size):
+        if not self._referenced(digest):
+            self._bytes -= size
+            try:
+                os.remove(self._object_path(digest))
+            except OSError:
+                pass
+
+    ## evicts least recently used pages until the cache fits in max_bytes, in the caller's transaction. Bodies shared
+    ## by several urls are only counted once
+    def _evict(self):
+        if self.max_bytes is None or self._bytes <= self.max_bytes:
+            return
+        ## the least recently used are only known once every read is in the index
+        self._write_accessed()
+        ## oldest pages first, a batch at a time: usually one or two pages are enough
+        while self._bytes > self.max_bytes:
+            oldest = self.connection.execute(
+                "SELECT url, digest, size FROM pages ORDER BY accessed_at LIMIT 100").fetchall()
+            if not oldest:
+                break
+            for url, digest, size in oldest:
+                self.connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+                self.stats['evictions'] += 1
+                self._drop_object(digest, size)
+                if self._bytes <= self.max_bytes:
+                    break
+
+    ## Output: hit ratio and the stats counters, for printing at the end of a run
+    def summary(self):
+        lookups = self.stats['hits'] + self.stats['misses'] + self.stats['stale']
+        ratio = 100.0 * self.stats['hits'] / lookups if lookups else 0.0
+        return 'Cache: {hits} hits, {misses} misses, {stale} stale, {stores} stored, {evictions} evicted'.format(
+            **self.stats) + ' ({:.0f}% hit rate)'.format(ratio)
+
+    def close(self):
+        with self._lock:
+            self._write_accessed()
+            self.connection.close()
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Fetcher that answers from the cache and only asks fetcher (lw_fetch.HttpFetcher, DriverFetcher, ...) for pages
+## that aren't cached or have gone stale. Stale pages are revalidated with a conditional request when the server
+## sent validators for them. offline=True never goes to the website: every cached page counts as fresh and
+## a page that isn't cached raises CacheMiss.
+class CachingFetcher(object):
+
+    def __init__(self, fetcher, cache, offline=False):
+        self.fetcher = fetcher
+        self.cache = cache
+        self.offline = offline
+
+    def fetch(self, url):
+        return self.fetch_page(url).html
+
+    ## Output: lw_fetch.Page of url. Cached pages come back as full pages (never not_modified), whatever the
+    ## caller's etag/last_modified are
+    def fetch_page(self, url, etag=None, last_modified=None):
+        page = self.cache.get(url, allow_stale=self.offline)
+        if page is not None:
+            return page
+        if self.offline:
+            raise CacheMiss(url)
+
+        cached = self.cache.validators(url)
+        if cached is not None and any(cached):
+            page = self.fetcher.fetch_page(url, *cached)
+            if page.not_modified:
+                self.cache.touch(url)
+                return self.cache.get(url, allow_stale=True)
+        else:
+            page = self.fetcher.fetch_page(url)
+
+        self.cache.put(page)
+        return page
+
+    def close(self):
+        if self.fetcher is not None:
+            self.fetcher.close()
+#######################################################################################################################
@@ -0,0 +1,125 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - resumable crawl checkpoints
+## Filename: lw_checkpoint.py
+##
+## Description:
+##          Keeps track of how far a crawl got: letters whose list of
+##          lawyers is done, the lawyers' links found, the links already
+##          written out and the pages that failed along with how many
+##          times they were tried. The checkpoint is saved to a JSON file
+##          (atomically, so a crash mid-save never corrupts it) and a
+##          restarted run picks up where the last one stopped.
+##
+######################################################################################
+######################################################################################
+
+import os
+import json
+import time
+import threading
+#######################################################################################################################
+#######################################################################################################################
+
+
+## Crawl checkpoint kept in the JSON file at path. An unfinished checkpoint found there is resumed (resumed is then
+## True); a finished one is started over. A page or letter is given up on once it failed max_attempts times, over
+## all runs. Safe to use from several worker threads.
+class CrawlFrontier(object):
+
+    def __init__(self, path, max_attempts=5, save_interval=10.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+
+        checkpoint = {}
+        if os.path.exists(path):
+            with open(path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            if checkpoint.get('finished'):
+                checkpoint = {}
+
+        self.resumed = bool(checkpoint)
+        self.letters = checkpoint.get('letters', {})
+        self.completed = set(checkpoint.get('completed', []))
+        self.failures = checkpoint.get('failures', {})
+
+    ## list of lawyers links found for letter in an earlier run, or None if the letter isn't done
+    def letter_links(self, letter):
+        with self._lock:
+            return self.letters.get(letter)
+
+    def letter_done(self, letter, links):
+        with self._lock:
+            self.letters[letter] = list(links)
+            self.failures.pop('letter:' + letter, None)
+
+    ## True if url was already written out
+    def is_done(self, url):
+        with self._lock:
+            return url in self.completed
+
+    ## marks urls as written out
+    def done(self, *urls):
+        with self._lock:
+            for url in urls:
+                self.completed.add(url)
+                self.failures.pop(url, None)
+
+    ## records a failed attempt at key (a lawyer's link, or 'letter:' + letter).
+    ## Output: number of times key has failed so far, over all runs
+    def failed(self, key, error):
+        with self._lock:
+            failure = self.failures.setdefault(key, {'attempts': 0})
+            failure['attempts'] += 1
+            failure['error'] = str(error).strip().split('\n')[0]
+            return failure['attempts']
+
+    ## True if key failed too many times to try again
+    def gave_up(self, key):
+        with self._lock:
+            return self.failures.get(key, {}).get('attempts', 0) >= self.max_attempts
+
+    ## keys given up on, with the last error of each
+    def given_up(self):
+        with self._lock:
+            return dict((key, failure['error']) for key, failure in self.failures.items()
+                        if failure['attempts'] >= self.max_attempts)
+
+    ## True once save_interval seconds went by since the last save
+    def due(self):
+        return time.monotonic() - self._last_save >= self.save_interval
+
+    ## writes the checkpoint to a temporary file and moves it over the old one, which is atomic
+    def save(self, finished=False):
+        with self._lock:
+            checkpoint = {
+                'finished': finished,
+                'letters': self.letters,
+                'completed': sorted(self.completed),
+                'failures': self.failures,
+            }
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as checkpoint_file:
+                json.dump(checkpoint, checkpoint_file)
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+            os.replace(temp_path, self.path)
+            self._last_save = time.monotonic()
+
+    ## saves the checkpoint as finished, so the next run starts over
+    def finish(self):
+        self.save(finished=True)
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## seconds to wait before retrying something that failed attempt times: backoff, 2*backoff, 4*backoff ...
+## capped at limit
+def backoff_delay(attempt, backoff=1.0, limit=60.0):
+    return min(limit, backoff * 2 ** max(0, attempt - 1))
+#######################################################################################################################
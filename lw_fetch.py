@@ -0,0 +1,602 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - fetch engine
+## Filename: lw_fetch.py
+##
+## Description:
+##          Helpers used by the scraper to fetch lawyer pages concurrently:
+##          a worker pool where every thread owns its own resource (e.g. a
+##          headless Chrome driver), a per-host politeness limiter and the
+##          fetch backends (plain http with pooled keep-alive connections,
+##          or a selenium driver).
+##
+######################################################################################
+######################################################################################
+
+import re
+import threading
+import time
+import email.utils
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+import lw_metrics
+#######################################################################################################################
+#######################################################################################################################
+
+
+## creates a headless chrome driver with the same options main() has always used.
+## Output: selenium chrome driver
+def headless_chrome():
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--window-size=1920x1080")
+    return webdriver.Chrome(chrome_options=chrome_options)
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Limits how hard a single host is hit: at most max_per_host requests in flight at a time and
+## at least min_interval seconds between the start of two requests to the same host.
+class HostLimiter(object):
+
+    def __init__(self, max_per_host=4, min_interval=0.0):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._next_start = {}
+
+    def _host(self, url):
+        return urlsplit(url).netloc
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._slots[host]
+
+    ## blocks until a request to url's host is allowed to start
+    def acquire(self, url):
+        host = self._host(url)
+        self._semaphore(host).acquire()
+
+        ## reserves the next start time for this host so concurrent workers queue up behind each other
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self, url):
+        self._semaphore(self._host(url)).release()
+
+    ## with limiter.slot(url): ... wraps a single request. kind is only there for the AdaptiveLimiter's sake
+    @contextmanager
+    def slot(self, url, kind=None):
+        self.acquire(url)
+        try:
+            yield
+        finally:
+            self.release(url)
+
+    ## seconds to wait for a page of url's host. Always default, see AdaptiveLimiter for measured timeouts
+    def timeout(self, url, default, kind=None):
+        return default
+
+    ## seconds between two checks for an element while waiting for a page
+    def poll_interval(self, url, kind=None):
+        return 0.5
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## most 429/503 answers a page may get in a run before it is skipped. The host is paused after each one, so they only
+## add up when the website keeps refusing it
+THROTTLED_RETRIES = 20
+
+
+## raised for a 429 Too Many Requests or 503 Service Unavailable answer. retry_after is how many seconds the server
+## asked to wait, None if it didn't say
+class Throttled(requests.HTTPError):
+
+    def __init__(self, url, status, retry_after=None):
+        message = '{} {}'.format(status, url)
+        if retry_after is not None:
+            message += ' (retry after {:.0f}s)'.format(retry_after)
+        super(Throttled, self).__init__(message)
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+
+## Output: seconds asked for by a Retry-After header (a number of seconds or an http date), None if there is none
+def retry_after_seconds(value):
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+## kinds of request an AdaptiveLimiter keeps the latencies of apart: a directory listing takes seconds of clicking
+## through postbacks, a lawyer's page a fraction of that and a picture less still, so one's timeouts can't come from
+## the others' latencies
+PAGE = 'page'
+LISTING = 'listing'
+IMAGE = 'image'
+
+
+## what an AdaptiveLimiter knows about a host
+class _HostRate(object):
+
+    def __init__(self, limit, interval, window, max_limit, min_interval):
+        self.limit = limit
+        self.interval = interval
+        self.max_limit = max_limit
+        self.min_interval = min_interval
+        self.in_flight = 0
+        self.next_start = 0.0
+        self.paused_until = 0.0
+        self.decreased_at = 0.0
+        self.ceiling = None
+        self.window = window
+        ## kind of request: its last window latencies, and them sorted (None until needed)
+        self.latencies = {}
+        self.sorted = {}
+        self.errors = deque(maxlen=window)
+        self.throttled = 0
+
+    def samples(self, kind):
+        if kind not in self.latencies:
+            self.latencies[kind] = deque(maxlen=self.window)
+        return self.latencies[kind]
+
+    def add(self, kind, latency):
+        self.samples(kind).append(latency)
+        self.sorted[kind] = None
+
+    def percentile(self, percent, kind=PAGE):
+        if self.sorted.get(kind) is None:
+            self.sorted[kind] = sorted(self.samples(kind))
+        ordered = self.sorted[kind]
+        return ordered[min(len(ordered) - 1, int(percent / 100.0 * len(ordered)))]
+
+
+## Limiter that finds the fastest rate a host sustains. Like HostLimiter it bounds the requests in flight and spaces
+## their starts, but per host the bounds move AIMD-style with what the host's answers look like:
+##  - every request that succeeds at a normal latency raises the concurrency limit by 1/limit (about one more per
+##    round of requests, up to max_per_host) and shortens the spacing by interval_step (down to min_interval).
+##    Within one request of the limit the host last struggled at, the limit only climbs a tenth as fast
+##  - a timeout, connection error or server error halves the limit (down to 1) and doubles the spacing (up to
+##    max_interval), once per burst: requests that started before the last decrease don't decrease again
+##  - a 429/503 (Throttled) does the same and also pauses the host for its Retry-After, or for backoff seconds
+## Latencies over the last window requests of the same kind (PAGE, LISTING or IMAGE) give the timeouts
+## (timeout_factor * p99, within min_timeout and max_timeout) and the interval between checks while waiting for a
+## page. Other exceptions (e.g. a page missing
+## from the cache) leave the rate alone. Throttled answers are counted in metrics, if given. configure() gives a host
+## bounds of its own.
+class AdaptiveLimiter(object):
+
+    def __init__(self, max_per_host=4, min_interval=0.0, max_interval=10.0, interval_step=0.01, backoff=5.0,
+                 window=200, timeout_factor=3.0, min_timeout=2.0, max_timeout=30.0, metrics=None):
+        self.max_per_host = max(1, max_per_host)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval_step = interval_step
+        self.backoff = backoff
+        self.window = window
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.metrics = metrics
+        self._hosts = {}
+        self._bounds = {}
+        self._changed = threading.Condition()
+
+    def _host(self, url):
+        return urlsplit(url).netloc
+
+    ## sets max_per_host and/or min_interval for url's host only, e.g. from a site's profile. Must be called before
+    ## the first request to the host
+    def configure(self, url, max_per_host=None, min_interval=None):
+        with self._changed:
+            self._bounds[self._host(url)] = (max(1, max_per_host) if max_per_host is not None else None, min_interval)
+
+    ## must be called with _changed held
+    def _rate(self, host):
+        rate = self._hosts.get(host)
+        if rate is None:
+            max_per_host, min_interval = self._bounds.get(host, (None, None))
+            max_per_host = max_per_host if max_per_host is not None else self.max_per_host
+            min_interval = min_interval if min_interval is not None else self.min_interval
+            ## starts halfway and climbs from there
+            rate = self._hosts[host] = _HostRate(max(1.0, max_per_host / 2.0), min_interval, self.window,
+                                                 max_per_host, min_interval)
+        return rate
+
+    ## blocks until a request to url's host is allowed to start
+    def acquire(self, url):
+        host = self._host(url)
+        with self._changed:
+            rate = self._rate(host)
+            while True:
+                now = time.monotonic()
+                if now < rate.paused_until:
+                    self._changed.wait(rate.paused_until - now)
+                elif rate.in_flight >= int(rate.limit):
+                    self._changed.wait()
+                else:
+                    break
+            rate.in_flight += 1
+            start = max(now, rate.next_start)
+            rate.next_start = start + rate.interval
+        if start > now:
+            time.sleep(start - now)
+
+    ## starts a request to url's host if it is allowed to start right now, without waiting.
+    ## Output: True if it started (release() it like one from acquire()), False if not
+    def try_acquire(self, url):
+        with self._changed:
+            rate = self._rate(self._host(url))
+            now = time.monotonic()
+            if now < rate.paused_until or now < rate.next_start or rate.in_flight >= int(rate.limit):
+                return False
+            rate.in_flight += 1
+            rate.next_start = now + rate.interval
+            return True
+
+    ## waits up to timeout seconds for a request to end, after try_acquire() said no
+    def wait(self, timeout):
+        with self._changed:
+            self._changed.wait(timeout)
+
+    ## ends a request to url's host. latency is how long it took, error the exception it failed with, if it did,
+    ## started when it started (time.monotonic()), kind what kind of request it was
+    def release(self, url, latency=None, error=None, started=None, kind=PAGE):
+        with self._changed:
+            rate = self._rate(self._host(url))
+            rate.in_flight -= 1
+
+            if isinstance(error, Throttled):
+                rate.throttled += 1
+                rate.paused_until = max(rate.paused_until, time.monotonic() + (
+                    error.retry_after if error.retry_after is not None else self.backoff))
+                self._decrease(rate, started)
+                if self.metrics is not None:
+                    self.metrics.count('throttled')
+            elif isinstance(error, (requests.RequestException, WebDriverException)):
+                rate.errors.append(True)
+                self._decrease(rate, started)
+            elif error is None and latency is not None:
+                normal = len(rate.samples(kind)) < 20 or latency <= 2 * rate.percentile(50, kind)
+                rate.add(kind, latency)
+                rate.errors.append(False)
+                ## a slow answer is an early sign of a struggling host: the rate holds instead of climbing
+                if normal:
+                    step = 1.0 / rate.limit if rate.ceiling is None or rate.limit + 1 < rate.ceiling else 0.1 / rate.limit
+                    rate.limit = min(rate.max_limit, rate.limit + step)
+                    rate.interval = max(rate.min_interval, rate.interval - self.interval_step)
+            self._changed.notify_all()
+
+    def _decrease(self, rate, started):
+        if started is not None and started < rate.decreased_at:
+            return
+        rate.ceiling = rate.limit
+        rate.limit = max(1.0, rate.limit / 2.0)
+        rate.interval = min(self.max_interval, max(2 * rate.interval, 0.1))
+        rate.decreased_at = time.monotonic()
+
+    ## with limiter.slot(url): ... wraps a single request of kind, timing it and learning from how it ended
+    @contextmanager
+    def slot(self, url, kind=PAGE):
+        self.acquire(url)
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as err:
+            self.release(url, error=err, started=start, kind=kind)
+            raise
+        except BaseException:
+            self.release(url, kind=kind)
+            raise
+        self.release(url, latency=time.monotonic() - start, started=start, kind=kind)
+
+    ## seconds to wait for a request of kind to url's host: timeout_factor times the p99 latency of that kind seen so
+    ## far, default until there are enough requests to tell
+    def timeout(self, url, default, kind=PAGE):
+        with self._changed:
+            rate = self._rate(self._host(url))
+            if len(rate.samples(kind)) < 20:
+                return default
+            return min(self.max_timeout, max(self.min_timeout, self.timeout_factor * rate.percentile(99, kind)))
+
+    ## seconds between two checks for an element while waiting for a page of kind: a fifth of the median latency, so
+    ## fast pages aren't held up by polling and slow ones aren't polled for nothing
+    def poll_interval(self, url, kind=PAGE):
+        with self._changed:
+            rate = self._rate(self._host(url))
+            if not rate.samples(kind):
+                return 0.1
+            return min(0.5, max(0.02, rate.percentile(50, kind) / 5.0))
+
+    ## Output: for every host, its current concurrency limit and spacing, the latency percentiles of its pages (and
+    ## under kinds those of every kind of request) and its error rate
+    def stats(self):
+        with self._changed:
+            stats = {}
+            for host, rate in self._hosts.items():
+                kinds = dict((kind, {'p50': round(rate.percentile(50, kind), 3),
+                                     'p95': round(rate.percentile(95, kind), 3)})
+                             for kind, latencies in rate.latencies.items() if latencies)
+                stats[host] = {
+                    'limit': round(rate.limit, 2),
+                    'interval': round(rate.interval, 3),
+                    'p50': kinds.get(PAGE, {}).get('p50'),
+                    'p95': kinds.get(PAGE, {}).get('p95'),
+                    'kinds': kinds,
+                    'error_rate': round(sum(rate.errors) / float(len(rate.errors)), 3) if rate.errors else 0.0,
+                    'throttled': rate.throttled,
+                }
+            return stats
+
+    ## one line per host, for printing at the end of a run
+    def summary(self):
+        return '\n'.join('Rate {}: {limit} in flight, {interval}s apart, p50 {p50}s, p95 {p95}s, {error_rate:.0%} '
+                         'errors, throttled {throttled} times'.format(host, **stats)
+                         for host, stats in sorted(self.stats().items()))
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Runs fn(resource, item) for every item across a number of worker threads. Every thread lazily creates its own
+## resource with make_resource (a driver is not safe to share between threads) and close_resource is called on each
+## of them once the work is done. Results come back in the same order as items, whatever order they finish in.
+class WorkerPool(object):
+
+    def __init__(self, make_resource, workers, close_resource=None):
+        self.make_resource = make_resource
+        self.workers = max(1, workers)
+        self.close_resource = close_resource
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._resources = []
+
+    def _resource(self):
+        if not hasattr(self._local, 'resource'):
+            self._local.resource = self.make_resource()
+            with self._lock:
+                self._resources.append(self._local.resource)
+        return self._local.resource
+
+    def _call(self, fn, item):
+        return fn(self._resource(), item)
+
+    ## returns list of fn results in the order of items. The first exception raised by a worker is re-raised here.
+    def map(self, fn, items):
+        return list(self.imap(fn, items))
+
+    ## generator version of map: yields fn results in the order of items as soon as they are ready. At most window
+    ## items (default: twice the number of workers) are in flight or waiting to be yielded, so memory stays flat
+    ## however many items there are.
+    def imap(self, fn, items, window=None):
+        window = window or self.workers * 2
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(self._call, fn, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            ## on failure (or if the caller stops early) the queued pages are dropped instead of fetched for nothing
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            self.close()
+
+    def close(self):
+        with self._lock:
+            resources, self._resources = self._resources, []
+        if self.close_resource is not None:
+            for resource in resources:
+                try:
+                    self.close_resource(resource)
+                except Exception:
+                    pass
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## id of the element holding a lawyer's information. A page without it was not rendered properly
+MAIN_CONTENT = 'RightColumnMainContent'
+
+
+## a fetched page. etag/last_modified are the validators the server sent along, if any. not_modified is True
+## (and html None) when the server answered a conditional request with 304 Not Modified
+Page = namedtuple('Page', ['url', 'html', 'etag', 'last_modified', 'not_modified'])
+
+
+## returns True if html contains an element with the given id
+def has_element_id(html, element_id):
+    return re.search(r'''id\s*=\s*["']?%s["'\s>/]''' % re.escape(element_id), html) is not None
+
+
+## creates a requests session that keeps connections to a host alive and reuses them across threads, asks for
+## gzip'ed pages and retries failed requests with exponential backoff (backoff, 2*backoff, 4*backoff ... seconds).
+## 429 and 503 answers aren't retried here, they are the limiter's business (see HttpFetcher and AdaptiveLimiter)
+## Input: pool_size should be at least the number of threads sharing the session
+## Output: requests session
+def http_session(pool_size=10, retries=3, backoff=0.5):
+    ## 429 and 503 are left to the limiter, see HttpFetcher
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(500, 502, 504),
+                  allowed_methods=frozenset(['GET', 'HEAD']), respect_retry_after_header=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+    return session
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Fetches pages with a selenium driver and waits for wait_for element to be present before returning the page
+## source. If no driver is given, one is created with make_driver the first time it is needed and quit on close().
+## The page loads and waits are timed in metrics (lw_metrics.Metrics), if given. With a limiter (AdaptiveLimiter)
+## how often it checks for the element follows the latencies the limiter measured, and the wait grows past timeout
+## with them, but never gets shorter: the measured latencies are mostly plain http requests, a browser takes
+## longer.
+class DriverFetcher(object):
+
+    def __init__(self, driver=None, make_driver=headless_chrome, timeout=5, wait_for=MAIN_CONTENT, metrics=None,
+                 limiter=None):
+        self.driver = driver
+        self.make_driver = make_driver
+        self.timeout = timeout
+        self.wait_for = wait_for
+        self.metrics = metrics if metrics is not None else lw_metrics.Metrics()
+        self.limiter = limiter if limiter is not None else HostLimiter()
+        self._owns_driver = driver is None
+
+    ## Output: html of url. Raises TimeoutException if wait_for element does not show up in time
+    def fetch(self, url):
+        if self.driver is None:
+            self.driver = self.make_driver()
+
+        with self.metrics.timer('driver.get'):
+            self.driver.get(url)
+        try:
+            with self.metrics.timer('driver.wait'):
+                wait = WebDriverWait(self.driver, max(self.timeout, self.limiter.timeout(url, self.timeout)),
+                                     poll_frequency=self.limiter.poll_interval(url))
+                wait.until(EC.presence_of_element_located((By.ID, self.wait_for)))
+        except TimeoutException:
+            self.metrics.count('timeouts')
+            raise
+        html = self.driver.page_source
+        self.metrics.count('bytes', len(html))
+        return html
+
+    ## Output: Page of url. A browser can't make conditional requests, so the validators are ignored
+    def fetch_page(self, url, etag=None, last_modified=None):
+        return Page(url, self.fetch(url), None, None, False)
+
+    def close(self):
+        if self._owns_driver and self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Fetches server rendered pages with a plain http request, no browser involved. When the page that comes back is
+## missing the wait_for element (error page, javascript-only rendering, ...) the url is handed to fallback
+## (usually a DriverFetcher), if there is one. Requests, bytes, timeouts and fallbacks are counted in metrics, if
+## given. A 429 or 503 answer raises Throttled instead of falling back: the host wants fewer requests, not a
+## browser. With a limiter (AdaptiveLimiter) the request timeout follows the latencies the limiter measured.
+class HttpFetcher(object):
+
+    def __init__(self, session, fallback=None, timeout=10, wait_for=MAIN_CONTENT, metrics=None, limiter=None):
+        self.session = session
+        self.fallback = fallback
+        self.timeout = timeout
+        self.wait_for = wait_for
+        self.metrics = metrics if metrics is not None else lw_metrics.Metrics()
+        self.limiter = limiter if limiter is not None else HostLimiter()
+
+    ## Output: html of url. Raises requests.RequestException if the request fails and there is no fallback
+    def fetch(self, url):
+        return self.fetch_page(url).html
+
+    ## Output: Page of url. Given the etag/last_modified validators from an earlier fetch the request is
+    ## conditional, and an unchanged page comes back as not_modified without being downloaded again
+    def fetch_page(self, url, etag=None, last_modified=None):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        try:
+            with self.metrics.timer('http.get'):
+                response = self.session.get(url, headers=headers, timeout=self.limiter.timeout(url, self.timeout))
+            if response.status_code == 304:
+                self.metrics.count('not_modified')
+                return Page(url, None, etag, last_modified, True)
+            if response.status_code in (429, 503):
+                raise Throttled(url, response.status_code, retry_after_seconds(response.headers.get('Retry-After')))
+            response.raise_for_status()
+            self.metrics.count('bytes', len(response.content))
+            html = response.text
+        except Throttled:
+            raise
+        except requests.RequestException as err:
+            if isinstance(err, requests.Timeout):
+                self.metrics.count('timeouts')
+            if self.fallback is None:
+                raise
+            self.metrics.count('fallbacks')
+            return self.fallback.fetch_page(url)
+
+        if self.fallback is not None and not has_element_id(html, self.wait_for):
+            self.metrics.count('fallbacks')
+            return self.fallback.fetch_page(url)
+        return Page(url, html, response.headers.get('ETag'), response.headers.get('Last-Modified'), False)
+
+    def close(self):
+        if self.fallback is not None:
+            self.fallback.close()
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Fetcher that takes a limiter (HostLimiter or AdaptiveLimiter) slot around every request of fetcher, so pages wait
+## for their host's turn, and the adaptive limiter learns from how long they took. Wrapped in an lw_cache
+## CachingFetcher, only the pages that really go to the website do: cache hits are neither held back by the limiter
+## nor counted in its latencies.
+class LimitedFetcher(object):
+
+    def __init__(self, fetcher, limiter):
+        self.fetcher = fetcher
+        self.limiter = limiter
+
+    def fetch(self, url):
+        return self.fetch_page(url).html
+
+    def fetch_page(self, url, etag=None, last_modified=None):
+        with self.limiter.slot(url):
+            return self.fetcher.fetch_page(url, etag, last_modified)
+
+    def close(self):
+        self.fetcher.close()
+#######################################################################################################################
@@ -0,0 +1,212 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - lawyer headshots
+## Filename: lw_images.py
+##
+## Description:
+##          Downloads the lawyers' pictures (the bioPhoto behind the Image
+##          field) over the scraper's http connection pool and keeps them on
+##          disk named after the sha256 of their content, so a picture used
+##          by several lawyers, or unchanged since the last run, is stored
+##          once. Pictures already stored are requested conditionally
+##          (ETag / Last-Modified) and only come back when they changed.
+##          Size-limited thumbnails are made by a pool of worker threads,
+##          if Pillow is installed.
+##
+##          store = ImageStore('LW_Images')
+##          image_path, image_hash = store.download(session, lawyer['Image'])
+##
+######################################################################################
+######################################################################################
+
+import os
+import io
+import time
+import sqlite3
+import hashlib
+import threading
+import mimetypes
+import concurrent.futures
+from collections import namedtuple
+
+import lw_fetch
+import lw_metrics
+
+## optional, only needed for thumbnails. Imported the first time an ImageStore makes them
+PIL = None
+#######################################################################################################################
+#######################################################################################################################
+
+## longest side of a thumbnail in pixels
+THUMBNAIL_SIZE = 200
+
+## file extensions of the picture types the website serves
+EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif', 'image/webp': '.webp'}
+
+## a stored picture: the path of its file and the sha256 of its content
+StoredImage = namedtuple('StoredImage', ['path', 'digest'])
+
+
+## Pictures in directory path: objects/<first 2 of sha256>/<sha256>.<ext> for the downloaded files,
+## thumbnails/<first 2 of sha256>/<sha256>.jpg for their thumbnails (at most thumbnail_size pixels on their longer
+## side, made by thumbnail_workers threads; thumbnail_size=None makes none) and a small SQLite index of which url
+## has which content, with the validators it was served with. Downloads are timed and counted in metrics
+## (lw_metrics.Metrics). Safe to use from several worker threads.
+class ImageStore(object):
+
+    def __init__(self, path, thumbnail_size=THUMBNAIL_SIZE, thumbnail_workers=2, timeout=10, metrics=None):
+        self.path = path
+        self.thumbnail_size = thumbnail_size
+        self.timeout = timeout
+        self.metrics = metrics if metrics is not None else lw_metrics.Metrics()
+        self.stats = dict.fromkeys(['downloaded', 'not_modified', 'reused', 'stored', 'thumbnails', 'failed'], 0)
+        self._lock = threading.Lock()
+        ## urls already handled this run, they are not requested again, and pictures whose thumbnail was started
+        self._done = {}
+        self._thumbnailed = set()
+
+        global PIL
+        if thumbnail_size and PIL is None:
+            try:
+                import PIL.Image
+            except ImportError:
+                print('Pillow is not installed (pip install Pillow), no thumbnails will be made')
+        self._thumbnails = concurrent.futures.ThreadPoolExecutor(
+            max(1, thumbnail_workers), thread_name_prefix='thumbnail') if thumbnail_size and PIL else None
+
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(path, 'index.db'), check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS images (
+  url TEXT PRIMARY KEY,
+  digest TEXT NOT NULL,
+  extension TEXT NOT NULL,
+  etag TEXT,
+  last_modified TEXT,
+  fetched_at REAL NOT NULL
+)""")
+        self.connection.commit()
+
+    def object_path(self, digest, extension):
+        return os.path.join(self.path, 'objects', digest[:2], digest + extension)
+
+    def thumbnail_path(self, digest):
+        return os.path.join(self.path, 'thumbnails', digest[:2], digest + '.jpg')
+
+    ## Output: StoredImage of url from the last time it was downloaded, None if it never was or its file is gone
+    def lookup(self, url):
+        with self._lock:
+            row = self.connection.execute("SELECT digest, extension FROM images WHERE url = ?", (url,)).fetchone()
+        if row is None or not os.path.exists(self.object_path(*row)):
+            return None
+        return StoredImage(self.object_path(*row), row[0])
+
+    ## downloads url's picture with session (requests.Session), unless it is stored and the server says it hasn't
+    ## changed, and makes its thumbnail if it has none yet. Every url is only requested once per ImageStore.
+    ## Output: StoredImage of the picture
+    def download(self, session, url):
+        with self._lock:
+            stored = self._done.get(url)
+            if stored is not None:
+                self.stats['reused'] += 1
+                return stored
+            row = self.connection.execute(
+                "SELECT digest, extension, etag, last_modified FROM images WHERE url = ?", (url,)).fetchone()
+
+        headers = {}
+        if row is not None and os.path.exists(self.object_path(row[0], row[1])):
+            if row[2]:
+                headers['If-None-Match'] = row[2]
+            if row[3]:
+                headers['If-Modified-Since'] = row[3]
+
+        try:
+            with self.metrics.timer('image.get'):
+                response = session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code in (429, 503):
+                raise lw_fetch.Throttled(url, response.status_code,
+                                         lw_fetch.retry_after_seconds(response.headers.get('Retry-After')))
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '')
+            if response.status_code != 304 and content_type and not content_type.startswith('image/'):
+                raise ValueError('not a picture: ' + content_type)
+        except Exception:
+            with self._lock:
+                self.stats['failed'] += 1
+            raise
+
+        if response.status_code == 304:
+            digest, extension = row[0], row[1]
+            with self._lock:
+                self.stats['not_modified'] += 1
+                self.connection.execute("UPDATE images SET fetched_at = ? WHERE url = ?", (time.time(), url))
+                self.connection.commit()
+        else:
+            data = response.content
+            self.metrics.count('image_bytes', len(data))
+            digest = hashlib.sha256(data).hexdigest()
+            extension = self._extension(url, content_type)
+            written = self._write(self.object_path(digest, extension), data)
+            with self._lock:
+                self.stats['downloaded'] += 1
+                self.stats['stored'] += written
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO images (url, digest, extension, etag, last_modified, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (url, digest, extension, response.headers.get('ETag'),
+                                                  response.headers.get('Last-Modified'), time.time()))
+                self.connection.commit()
+
+        stored = StoredImage(self.object_path(digest, extension), digest)
+        with self._lock:
+            self._done[url] = stored
+            thumbnail = digest not in self._thumbnailed
+            self._thumbnailed.add(digest)
+        if self._thumbnails is not None and thumbnail and not os.path.exists(self.thumbnail_path(digest)):
+            self._thumbnails.submit(self._make_thumbnail, stored)
+        return stored
+
+    @staticmethod
+    def _extension(url, content_type):
+        extension = EXTENSIONS.get((content_type or '').split(';')[0].strip().lower())
+        if extension is None:
+            extension = os.path.splitext(url.split('?')[0])[1].lower() or mimetypes.guess_extension(
+                content_type or '') or '.img'
+        return extension
+
+    ## writes data to path if no file with that content is there yet, under a temporary name first so a crash never
+    ## leaves a truncated picture behind. Output: True if the file was written
+    @staticmethod
+    def _write(path, data):
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(temp_path, 'wb') as image_file:
+            image_file.write(data)
+        os.replace(temp_path, path)
+        return True
+
+    def _make_thumbnail(self, stored):
+        try:
+            with self.metrics.timer('image.thumbnail'):
+                with PIL.Image.open(stored.path) as image:
+                    image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                    thumbnail = io.BytesIO()
+                    image.convert('RGB').save(thumbnail, 'JPEG', quality=85)
+                self._write(self.thumbnail_path(stored.digest), thumbnail.getvalue())
+            with self._lock:
+                self.stats['thumbnails'] += 1
+        except Exception as err:
+            print('Failed to make a thumbnail of ' + stored.path + ': ' + str(err).strip())
+
+    ## one line for printing at the end of a run
+    def summary(self):
+        return ('Images: {downloaded} downloaded, {not_modified} not modified, {reused} reused, {stored} new files, '
+                '{thumbnails} thumbnails, {failed} failed').format(**self.stats)
+
+    ## waits for the thumbnails still being made
+    def close(self):
+        if self._thumbnails is not None:
+            self._thumbnails.shutdown()
+        self.connection.close()
+#######################################################################################################################
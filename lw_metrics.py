@@ -0,0 +1,302 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - run instrumentation
+## Filename: lw_metrics.py
+##
+## Description:
+##          Times every stage of a run (listing letters, driver.get, the
+##          waits, http requests, parsing, writing) and counts pages, bytes,
+##          retries and timeouts. At the end of a run it reports latency
+##          percentiles per stage, pages/sec and peak memory as JSON and,
+##          optionally, as a Prometheus text file. An optional profiler
+##          records where the time goes in every worker thread.
+##
+######################################################################################
+######################################################################################
+
+import os
+import sys
+import json
+import time
+import random
+import pstats
+import cProfile
+import datetime
+import functools
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    ## not available on Windows, peak memory isn't reported there
+    resource = None
+#######################################################################################################################
+#######################################################################################################################
+
+## percentiles reported for every stage
+PERCENTILES = [50, 95, 99]
+
+
+## Durations of one stage. Count, total and max are exact; percentiles come from at most max_samples durations,
+## a uniform sample of all of them once there are more
+class Histogram(object):
+
+    def __init__(self, max_samples=100000):
+        self.max_samples = max_samples
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(seconds)
+        else:
+            ## reservoir sampling: every duration so far has the same chance to be in samples
+            index = random.randrange(self.count)
+            if index < self.max_samples:
+                self.samples[index] = seconds
+
+    ## Output: duration below which percent % of the samples fall (nearest rank), 0 if there are none
+    def percentile(self, percent):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(1, int(round(percent / 100.0 * len(ordered))))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    def summary(self):
+        summary = {
+            'count': self.count,
+            'total': round(self.total, 6),
+            'mean': round(self.total / self.count, 6) if self.count else 0.0,
+            'max': round(self.max, 6),
+        }
+        for percent in PERCENTILES:
+            summary['p{}'.format(percent)] = round(self.percentile(percent), 6)
+        return summary
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Timings and counters of one run. Safe to use from several worker threads.
+##
+##      with metrics.timer('parse'):
+##          lawyer_info = lw_profile.parse_profile(html, url)
+##      metrics.count('bytes', len(html))
+class Metrics(object):
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    ## adds the seconds a stage took
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.add(seconds)
+
+    ## times the block as one run of stage, also when it raises
+    @contextmanager
+    def timer(self, stage):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - start)
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def elapsed(self):
+        return time.monotonic() - self._start
+
+    ## Output: dictionary with the whole run: elapsed seconds, pages/sec, counters, peak memory and the latency
+    ## summary of every stage. extra (e.g. cache or state counts) is added as is
+    def report(self, **extra):
+        elapsed = self.elapsed()
+        with self._lock:
+            counters = dict(self.counters)
+            stages = dict((stage, histogram.summary()) for stage, histogram in sorted(self.stages.items()))
+
+        report = {
+            'started': datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'elapsed': round(elapsed, 3),
+            'pages_per_sec': round(counters.get('pages', 0) / elapsed, 3) if elapsed else 0.0,
+            'peak_rss_bytes': peak_rss(),
+            'counters': counters,
+            'stages': stages,
+        }
+        report.update(extra)
+        return report
+
+    ## Output: dictionary comparing the seconds spent in stage with those spent in baseline: totals, medians and the
+    ## ratio of the totals (None while baseline has nothing)
+    def compare(self, stage, baseline):
+        with self._lock:
+            summaries = [self.stages[name].summary() if name in self.stages else Histogram().summary()
+                         for name in (stage, baseline)]
+        comparison = {}
+        for name, summary in zip((stage, baseline), summaries):
+            comparison[name + '_seconds'] = summary['total']
+            comparison[name + '_p50'] = summary['p50']
+        comparison['ratio'] = round(summaries[0]['total'] / summaries[1]['total'], 3) if summaries[1]['total'] else None
+        return comparison
+
+    ## one line for printing at the end of a run
+    def summary(self):
+        report = self.report()
+        counters = report['counters']
+        line = 'Run: {:.1f}s, {} pages ({:.2f}/sec), {:.1f} MB fetched, {} retries, {} timeouts'.format(
+            report['elapsed'], counters.get('pages', 0), report['pages_per_sec'],
+            counters.get('bytes', 0) / 1024.0 / 1024.0, counters.get('retries', 0), counters.get('timeouts', 0))
+        if report['peak_rss_bytes'] is not None:
+            line += ', peak memory {:.0f} MB'.format(report['peak_rss_bytes'] / 1024.0 / 1024.0)
+        return line
+
+    def write_json(self, path, **extra):
+        _write_atomic(path, json.dumps(self.report(**extra), indent=4))
+
+    ## writes the run in the Prometheus text format, e.g. for node_exporter's textfile collector
+    def write_prometheus(self, path, prefix='lw'):
+        report = self.report()
+        lines = [
+            '# HELP {}_stage_seconds Seconds spent per stage of the scrape.'.format(prefix),
+            '# TYPE {}_stage_seconds summary'.format(prefix),
+        ]
+        for stage, summary in report['stages'].items():
+            for percent in PERCENTILES:
+                lines.append('{}_stage_seconds{{stage="{}",quantile="{}"}} {}'.format(
+                    prefix, stage, percent / 100.0, summary['p{}'.format(percent)]))
+            lines.append('{}_stage_seconds_sum{{stage="{}"}} {}'.format(prefix, stage, summary['total']))
+            lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(prefix, stage, summary['count']))
+
+        lines.append('# HELP {}_events_total Pages, bytes, retries, timeouts, ... counted during the run.'.format(
+            prefix))
+        lines.append('# TYPE {}_events_total counter'.format(prefix))
+        for counter, value in sorted(report['counters'].items()):
+            lines.append('{}_events_total{{event="{}"}} {}'.format(prefix, counter, value))
+
+        gauges = [('run_seconds', 'Length of the run.', report['elapsed']),
+                  ('pages_per_second', 'Pages fetched per second over the run.', report['pages_per_sec']),
+                  ('peak_rss_bytes', 'Peak resident memory of the scraper.', report['peak_rss_bytes'])]
+        for name, help_text, value in gauges:
+            if value is None:
+                continue
+            lines.append('# HELP {}_{} {}'.format(prefix, name, help_text))
+            lines.append('# TYPE {}_{} gauge'.format(prefix, name))
+            lines.append('{}_{} {}'.format(prefix, name, value))
+        _write_atomic(path, '\n'.join(lines) + '\n')
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Output: peak resident memory of the process in bytes, None where it can't be read
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+## writes text to a temporary file and moves it over path, so a reader never sees half a report
+def _write_atomic(path, text):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as report_file:
+        report_file.write(text)
+    os.replace(temp_path, path)
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## cProfile for a run spread over several threads. cProfile only sees the thread it was enabled in, so every thread
+## gets its own profile: running() profiles the calling thread, wrap(fn) profiles fn wherever it is called. dump()
+## merges them all into one pstats file (python -m pstats PATH, snakeviz, ...). From Python 3.12 on cProfile sees
+## every thread and only one profile can be enabled at a time, so a single profile is on while any thread is in
+## running(); calls of different threads can then show up as each other's callers.
+class Profiler(object):
+
+    def __init__(self):
+        self._local = threading.local()
+        self._profiles = []
+        self._lock = threading.Lock()
+        ## the one profile of all threads, and how many running() blocks are in it (Python 3.12+)
+        self._shared = cProfile.Profile() if sys.version_info >= (3, 12) else None
+        self._shared_depth = 0
+        if self._shared is not None:
+            self._profiles.append(self._shared)
+
+    def _profile(self):
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        return profile
+
+    ## profiles the block in the calling thread. Nested blocks leave profiling on until the outermost one ends
+    @contextmanager
+    def running(self):
+        if self._shared is not None:
+            with self._shared_running():
+                yield self
+            return
+
+        profile = self._profile()
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        if depth == 0:
+            profile.enable()
+        try:
+            yield self
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                profile.disable()
+
+    @contextmanager
+    def _shared_running(self):
+        with self._lock:
+            self._shared_depth += 1
+            if self._shared_depth == 1:
+                self._shared.enable()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._shared_depth -= 1
+                if self._shared_depth == 0:
+                    self._shared.disable()
+
+    def wrap(self, fn):
+        @functools.wraps(fn)
+        def profiled(*args, **kwargs):
+            with self.running():
+                return fn(*args, **kwargs)
+        return profiled
+
+    ## writes the merged profiles to path. Output: pstats.Stats of the merged profiles
+    def dump(self, path):
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        return stats
+#######################################################################################################################
@@ -0,0 +1,185 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - staged pipeline
+## Filename: lw_pipeline.py
+##
+## Description:
+##          Runs the scrape as a chain of stages connected by bounded
+##          queues: a source (the lawyers' links, found while the directory
+##          is still being listed) feeds the first stage, every stage has
+##          its own number of worker threads and the results come out the
+##          other end while the rest are still being worked on. A full
+##          queue makes the stages before it wait (back-pressure), so a
+##          slow stage never piles up work in memory.
+##
+##          for lawyer_info in Pipeline(links, [Stage('fetch', fetch, 8),
+##                                              Stage('parse', parse, 2)]):
+##              sink.write(lawyer_info)
+##
+######################################################################################
+######################################################################################
+
+import queue
+import threading
+#######################################################################################################################
+#######################################################################################################################
+
+## returned by a stage function to drop an item. Later stages don't see it and it isn't yielded
+SKIP = object()
+
+## end of input, passed down the queues
+_DONE = object()
+
+
+## A step of the pipeline: fn is called on every item with workers threads. With make_resource every worker thread
+## creates its own resource when it starts (e.g. a fetcher), calls fn(resource, item) and hands the resource to
+## close_resource when it stops.
+class Stage(object):
+
+    def __init__(self, name, fn, workers=1, make_resource=None, close_resource=None):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.make_resource = make_resource
+        self.close_resource = close_resource
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Runs the items of source through stages and yields the results. At most queue_size items wait between two stages.
+## ordered=True yields results in the order of source, whatever order the workers finish them in; at most
+## max_in_flight items (default: 4 * queue_size) are then between source and the caller at any time, so a single slow
+## item can't make the others pile up. The first exception raised by the source or a stage stops the pipeline and is
+## re-raised to the caller.
+class Pipeline(object):
+
+    def __init__(self, source, stages, queue_size=16, ordered=True, max_in_flight=None):
+        self.source = source
+        self.stages = list(stages)
+        self.queue_size = max(1, queue_size)
+        self.ordered = ordered
+        self.max_in_flight = max_in_flight or 4 * self.queue_size
+
+    def __iter__(self):
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        self._stop = threading.Event()
+        self._errors = []
+        self._in_flight = threading.Semaphore(self.max_in_flight) if self.ordered else None
+
+        threads = [threading.Thread(target=self._feed, args=(queues[0],), name='pipeline-source')]
+        for position, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for number in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(stage, queues[position], queues[position + 1], remaining, lock),
+                    name='pipeline-{}-{}'.format(stage.name, number)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for result in self._drain(queues[-1]):
+                yield result
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+    ## puts item on a queue, giving up if the pipeline is stopped meanwhile
+    def _put(self, target, item):
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    ## next item from a queue, or _DONE if the pipeline is stopped meanwhile
+    def _get(self, source):
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _fail(self, err):
+        self._errors.append(err)
+        self._stop.set()
+
+    def _feed(self, target):
+        try:
+            for number, item in enumerate(self.source):
+                if self._in_flight is not None:
+                    while not self._in_flight.acquire(timeout=0.1):
+                        if self._stop.is_set():
+                            return
+                if not self._put(target, (number, item)):
+                    return
+            self._put(target, _DONE)
+        except BaseException as err:
+            self._fail(err)
+
+    def _work(self, stage, source, target, remaining, lock):
+        resource = None
+        try:
+            if stage.make_resource is not None:
+                resource = stage.make_resource()
+
+            while True:
+                item = self._get(source)
+                if item is _DONE:
+                    ## lets the other workers of the stage see the end too
+                    self._put(source, _DONE)
+                    break
+
+                number, value = item
+                if value is not SKIP:
+                    value = stage.fn(resource, value) if stage.make_resource is not None else stage.fn(value)
+                if not self._put(target, (number, value)):
+                    break
+        except BaseException as err:
+            self._fail(err)
+        finally:
+            if resource is not None and stage.close_resource is not None:
+                try:
+                    stage.close_resource(resource)
+                except Exception:
+                    pass
+
+            ## last worker of the stage out passes the end on to the next stage
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._put(target, _DONE)
+
+    ## yields results from the last queue, back in source order if ordered
+    def _drain(self, source):
+        waiting = {}
+        expected = 0
+        while True:
+            item = self._get(source)
+            if self._errors:
+                raise self._errors[0]
+            if item is _DONE:
+                return
+
+            number, value = item
+            if not self.ordered:
+                if value is not SKIP:
+                    yield value
+                continue
+
+            waiting[number] = value
+            while expected in waiting:
+                value = waiting.pop(expected)
+                expected += 1
+                self._in_flight.release()
+                if value is not SKIP:
+                    yield value
+#######################################################################################################################
@@ -0,0 +1,360 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - profile extraction
+## Filename: lw_profile.py
+##
+## Description:
+##          Turns the html of a lawyer's webpage into the lawyer information
+##          (a compact Lawyer record) written to the JSON and SQL files. The
+##          page is parsed once and walked once: every element the scraper
+##          cares about is picked up from a lookup table keyed on its id.
+##
+######################################################################################
+######################################################################################
+
+import re
+import sys
+import json
+import time
+import hashlib
+import datetime
+from collections.abc import Mapping
+from json.encoder import encode_basestring_ascii
+from bs4 import BeautifulSoup
+#######################################################################################################################
+#######################################################################################################################
+
+## placeholder for domain name of website and name of company
+DOMAIN = 'https://www.lw.com'
+COMPANY = 'Latham & Watkins'
+
+## global directory webpage, where the lists of lawyers are
+DIRECTORY = DOMAIN + '/GlobalDirectory'
+
+## fields of a Lawyer, in the order they are written out
+## (ImagePath and ImageHash are only filled in when the pictures are downloaded, see lw_images)
+FIELDS = ['Name', 'Title', 'Location', 'Company', 'Phone', 'Email', 'LinkedIn', 'CV', 'Education', 'Biography',
+          'Experience', 'Expertise', 'AdmissionsQualifications', 'MembershipsAffiliations', 'NewsEvents',
+          'Publications', 'Clients', 'Distinctions', 'PriorAssociations', 'Image', 'ImagePath', 'ImageHash',
+          'WebpageURL', 'Timestamp']
+
+## id of the element holding a lawyer's information. A page without it has no lawyer on it
+MAIN_CONTENT = 'RightColumnMainContent'
+
+## elements whose text is a field as is
+LABELS = {
+    'ContentPlaceHolder1_HeadingPlaceHolder_NameLabel': 'Name',
+    'ContentPlaceHolder1_HeadingPlaceHolder_TitleLabel': 'Title',
+    'ContentPlaceHolder1_HeadingPlaceHolder_OfficesLabel': 'Location',
+    'PhoneNumberLabel': 'Phone',
+    'ContentPlaceHolder1_HeadingPlaceHolder_EmailLink': 'Email',
+}
+
+## areas whose paragraphs/list items are joined into one block of text
+TEXT_AREAS = {
+    'ExpertiseContentArea': ('Biography', ['p', 'li']),
+    'ExperienceContentArea': ('Experience', ['p', 'li', 'br']),
+}
+
+## right column "additional info" sections. Their ids all look like
+## ContentPlaceHolder1_RightColumnNavigationPlaceHolder_AdditionalInfoControl1_<Section>_AdditionalInfoSectionWrapper
+## Events and News both go into NewsEvents, events first.
+SECTION_ID = re.compile(r'_AdditionalInfoControl1_(\w+?)_AdditionalInfoSectionWrapper$')
+SECTIONS = {
+    'EventsSection': 'NewsEvents',
+    'NewsSection': 'NewsEvents',
+    'ThoughtLeadershipSection': 'Publications',
+    'AwardsRankingsSection': 'Distinctions',
+}
+SECTION_ORDER = ['EventsSection', 'NewsSection', 'ThoughtLeadershipSection', 'AwardsRankingsSection']
+
+## AttorneyMetaData list: each heading div is followed by a list. The lists come in this order
+META_ID = 'AttorneyMetaData'
+META_LISTS = ['AdmissionsQualifications', 'Education', 'Practices', 'Industries']
+
+## fields with few distinct values. Lawyers share one copy of each value instead of holding their own
+CATEGORICAL = ['Company', 'Title', 'Location', 'Timestamp']
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+_FIELD_SET = frozenset(FIELDS)
+_CATEGORICAL_SET = frozenset(CATEGORICAL)
+## '"Name": ', ... as json.dumps writes them
+_JSON_KEYS = [encode_basestring_ascii(field) + ': ' for field in FIELDS]
+
+
+## A lawyer's detailed information: one slot per field of FIELDS instead of a dictionary per lawyer, which takes a
+## fraction of the memory on big crawls. Reads like the dictionary it replaces (lawyer['Name'], lawyer.get('Image'),
+## dict(lawyer), ...) but only has the FIELDS keys, all of them, None when unknown. CATEGORICAL values set through
+## the constructor or lawyer[field] = value are interned. to_json() and row() write it out without building a
+## dictionary first.
+class Lawyer(Mapping):
+
+    __slots__ = FIELDS
+
+    def __init__(self, fields=None, **values):
+        if fields is not None:
+            values = dict(fields, **values)
+        for field in FIELDS:
+            value = values.get(field)
+            if field in _CATEGORICAL_SET and type(value) is str:
+                value = sys.intern(value)
+            object.__setattr__(self, field, value)
+
+    def __getitem__(self, field):
+        if field not in _FIELD_SET:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        if field not in _FIELD_SET:
+            raise KeyError(field)
+        if field in _CATEGORICAL_SET and type(value) is str:
+            value = sys.intern(value)
+        setattr(self, field, value)
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in _FIELD_SET else default
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __contains__(self, field):
+        return field in _FIELD_SET
+
+    ## Output: tuple of the values of columns, None for columns that aren't fields
+    def row(self, columns=FIELDS):
+        return tuple(getattr(self, column) if column in _FIELD_SET else None for column in columns)
+
+    def to_dict(self):
+        return dict(zip(FIELDS, self.row()))
+
+    ## Output: the lawyer as a JSON object, the same text json.dumps(lawyer.to_dict()) gives
+    def to_json(self):
+        return '{' + ', '.join(key + _json_value(getattr(self, field))
+                               for key, field in zip(_JSON_KEYS, FIELDS)) + '}'
+
+    def __repr__(self):
+        return 'Lawyer({!r})'.format(self.to_dict())
+
+    ## pickled as the tuple of its values, e.g. on its way back from a parse worker process
+    def __reduce__(self):
+        return _lawyer_from_row, (self.row(),)
+
+
+def _lawyer_from_row(row):
+    return Lawyer(zip(FIELDS, row))
+
+
+def _json_value(value):
+    if value is None:
+        return 'null'
+    if type(value) is str:
+        return encode_basestring_ascii(value)
+    return json.dumps(value)
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## parses html with the given parser ('html.parser', or the faster 'lxml' if it is installed)
+def make_soup(html, parser='html.parser'):
+    return BeautifulSoup(html, parser)
+
+
+## function scrapes the list of lawyers on a global directory webpage.
+## Input: html of the directory webpage showing the list of lawyers for a letter
+## Output: list of lawyers links
+def parse_directory(html, parser='html.parser'):
+    ## creates empty list to hold lawyer basic info
+    select_lawyer = []
+
+    ## parses page
+    soup = make_soup(html, parser)
+
+    ## finds table holding list/records of lawyers and appends lawyer basic info to select_laywer list
+    table = soup.findChild('table', {'id': 'PeopleList'})
+    if table is not None:
+        rows = table.findChildren('tr')
+        for row in rows:
+            links = row.findChildren('a')
+            for link in links:
+                if link:
+                    select_lawyer.append(link['href'])
+
+    ## each lawyer link has 'people' string in it, therefore only srings that match the criteria are added to
+    ## lawyers list. Links would be used to select each lawyer individually later on
+    lawyers = []
+    for i in select_lawyer:
+        if 'people' in i:
+            lawyers.append(i)
+
+    return lawyers
+
+
+## function scrapes a lawyer's webpage.
+## Input: html of a lawyer's webpage, link of that webpage
+## Output: Lawyer with the lawyer's detailed information, or None if the page has no lawyer information.
+def parse_profile(html, url, domain=DOMAIN, company=COMPANY, parser='html.parser'):
+    return extract_profile(make_soup(html, parser), url, domain, company)
+
+
+## parses a lawyer's webpage only if it changed since it was last scraped.
+## Input: html of a lawyer's webpage, link of that webpage and content_hash of the page from the last scrape (None if
+## it was never scraped)
+## Output: (content hash of the page, Lawyer with the lawyer's detailed information). The Lawyer is None if
+## the page has no lawyer information or its hash is still known_hash.
+def parse_changed(html, url, known_hash=None, domain=DOMAIN, company=COMPANY, parser='html.parser'):
+    soup = make_soup(html, parser)
+    page_hash = content_hash(soup)
+    if page_hash is None or page_hash == known_hash:
+        return page_hash, None
+    return page_hash, extract_profile(soup, url, domain, company)
+
+
+## parse_profile, or parse_changed if changed, timed. Only picklable values go in and out, so it can run in a worker
+## process (concurrent.futures.ProcessPoolExecutor).
+## Output: (content hash of the page or None, Lawyer with the lawyer's detailed information or None, seconds the
+## parsing took)
+def parse_timed(html, url, known_hash=None, changed=False, domain=DOMAIN, company=COMPANY, parser='html.parser'):
+    start = time.monotonic()
+    if changed:
+        page_hash, lawyer = parse_changed(html, url, known_hash, domain, company, parser)
+    else:
+        page_hash, lawyer = None, parse_profile(html, url, domain, company, parser)
+    return page_hash, lawyer, time.monotonic() - start
+
+
+## fingerprint of the RightColumnMainContent element, where all of a lawyer's information lives. Changes to the rest
+## of the page (navigation, footer, ...) don't change it. None if the page has no lawyer information
+def content_hash(soup):
+    content = soup.find(id=MAIN_CONTENT)
+    if content is None:
+        return None
+    return hashlib.sha1(str(content).encode('utf-8')).hexdigest()
+
+
+## same as parse_profile for an already parsed page
+def extract_profile(soup, url, domain=DOMAIN, company=COMPANY):
+    labels = {}
+    text_areas = {}
+    sections = {}
+    meta = None
+    pic = None
+    content = None
+
+    ## single walk over the page, only looking at elements with an id and images
+    for tag in soup.find_all(_is_candidate):
+        tag_id = tag.get('id')
+        ## the picture can have an id too, as ASP.NET gives one to most elements
+        if pic is None and tag.name == 'img' and 'bioPhoto' in tag.get('class', []):
+            pic = tag
+        elif tag_id is None:
+            continue
+        elif tag_id in LABELS:
+            labels[LABELS[tag_id]] = tag
+        elif tag_id in TEXT_AREAS:
+            text_areas[tag_id] = tag
+        elif tag_id == META_ID:
+            meta = tag
+        elif tag_id == MAIN_CONTENT:
+            content = tag
+        else:
+            match = SECTION_ID.search(tag_id)
+            if match and match.group(1) in SECTIONS:
+                sections[match.group(1)] = tag
+
+    if content is None:
+        return None
+
+    ## some data will be defaulted as None(NULL), some will be permenantly set as None as website doesn't have
+    ## that information.
+    lawyer = Lawyer()
+    for field, tag in labels.items():
+        lawyer[field] = tag.get_text(strip=True)
+    lawyer['Company'] = company
+
+    for tag_id, tag in text_areas.items():
+        field, children = TEXT_AREAS[tag_id]
+        lawyer[field] = _join_text(tag.find_all(children))
+
+    ## educational background, practices & industries and bar qualifications, each joined with a semicolon
+    lists = _meta_lists(meta)
+    lawyer['Education'] = "; ".join(str(uni) for uni in _first_children(lists.get('Education')))
+    if 'Practices' in lists:
+        lawyer['Expertise'] = "; ".join(_ascii(_text(item)) for name in ('Practices', 'Industries')
+                                        for item in _first_children(lists.get(name)))
+    lawyer['AdmissionsQualifications'] = "; ".join(
+        _text(bar) for bar in _first_children(lists.get('AdmissionsQualifications')))
+
+    ## News & Events, Thought Leadership and Awards & Rankings sections if available, joined with a semicolon
+    collected = {}
+    for section in SECTION_ORDER:
+        area = sections.get(section)
+        ul = area.find('ul') if area is not None else None
+        if ul is None:
+            continue
+        items = [li.get_text(" ", strip=True) for li in ul.find_all('li')]
+        collected.setdefault(SECTIONS[section], []).extend(item for item in items if item != 'more')
+    for field, items in collected.items():
+        lawyer[field] = "; ".join(items)
+
+    ## link to view picture of lawyer if available
+    if pic is not None and pic.get('src'):
+        lawyer['Image'] = domain + pic['src']
+
+    lawyer['WebpageURL'] = url
+
+    ## Get time in YYYY-Mon-DD format
+    lawyer['Timestamp'] = datetime.datetime.today().strftime("%Y-%b-%d")
+    return lawyer
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+def _is_candidate(tag):
+    return tag.has_attr('id') or tag.name == 'img'
+
+
+## maps each list in the AttorneyMetaData element to its META_LISTS name, by position of its heading div
+def _meta_lists(meta):
+    lists = {}
+    if meta is None:
+        return lists
+    for name, div in zip(META_LISTS, meta.find_all('div')):
+        ul = div.find_next_sibling('ul')
+        if ul is not None:
+            lists[name] = ul
+    return lists
+
+
+## first child (text or element) of every list item in ul
+def _first_children(ul):
+    if ul is None:
+        return []
+    return [li.contents[0] for li in ul.find_all('li') if li.contents]
+
+
+def _text(node):
+    if hasattr(node, 'get_text'):
+        return node.get_text(" ", strip=True)
+    return str(node).strip()
+
+
+## drops characters that are not ascii to ensure proper character encoding
+def _ascii(text):
+    return text.encode('ascii', 'ignore').decode("utf-8")
+
+
+## joins the text of elements into one space separated block of ascii text
+def _join_text(elements):
+    text = "".join(' ' + element.get_text(" ", strip=True) for element in elements)
+    return _ascii(text.replace("  ", " "))
+#######################################################################################################################
@@ -0,0 +1,241 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - full-text search
+## Filename: lw_search.py
+##
+## Description:
+##          Indexes lawyers' biographies, experience and expertise (with
+##          their name, title and office) in an SQLite FTS5 full-text index
+##          as the scraper writes them out, and searches it: keywords,
+##          "exact phrases", prefix* terms, AND/OR/NOT and column filters
+##          (Location: London), ranked by BM25.
+##
+##          python lw_search.py '"private equity" AND Location:London'
+##          python lw_search.py --build LW_Lawyers.jsonl
+##
+######################################################################################
+######################################################################################
+
+import re
+import sys
+import json
+import sqlite3
+import argparse
+from collections import namedtuple
+
+import lw_sinks
+#######################################################################################################################
+#######################################################################################################################
+
+## file the index is kept in
+INDEX_PATH = 'LW_Search.db'
+
+## indexed fields with their BM25 weight: a match in a lawyer's name or expertise counts for more than one somewhere
+## in a long biography
+SEARCH_FIELDS = [('Name', 10.0), ('Title', 2.0), ('Location', 2.0), ('Expertise', 5.0), ('Biography', 1.0),
+                 ('Experience', 1.0)]
+
+## one search result. score is the BM25 rank (lower is better), snippet the best matching part of the text with the
+## matched terms in [brackets]
+Hit = namedtuple('Hit', ['url', 'name', 'title', 'location', 'score', 'snippet'])
+
+## "quoted phrases" (with a prefix *), and a query's terms: phrases or runs of anything else but spaces
+PHRASE = r'"(?:[^"]|"")*"\*?'
+TERM = re.compile(PHRASE + r'|\S+')
+## FTS5 barewords: letters, digits, _ and any non-ASCII character
+BAREWORD = re.compile(r'^[\w\u0080-\U0010ffff]+$')
+
+
+## Output: query with every term that isn't valid FTS5 syntax quoted as a phrase, e.g. M&A -> "M&A" and
+## Washington, D.C. -> "Washington," "D.C.". Barewords (with a prefix *), "phrases", AND/OR/NOT, parentheses and
+## column filters on columns stay as they are
+def quote_terms(query, columns=()):
+    columns = set(column.lower() for column in columns)
+
+    def quote(term):
+        if term in ('AND', 'OR', 'NOT') or re.match(PHRASE + '$', term):
+            return term
+        if BAREWORD.match(term[:-1] if term.endswith('*') else term):
+            return term
+        column, colon, rest = term.partition(':')
+        if colon and column.lower() in columns and rest:
+            return column + ':' + quote(rest)
+        return '"{}"'.format(term.replace('"', '""'))
+
+    terms = []
+    for term in TERM.findall(query):
+        opened = len(term) - len(term.lstrip('('))
+        closed = len(term) - len(term.rstrip(')'))
+        core = term[opened:len(term) - closed]
+        terms.append(term[:opened] + (quote(core) if core else '') + term[len(term) - closed:])
+    return ' '.join(terms)
+
+
+## Full-text index of the lawyers in an SQLite file. Every lawyer is one FTS5 document, its rowid taken from the
+## documents table that maps WebpageURL to it, so a lawyer written again replaces its document instead of adding a
+## second one. Words are stemmed (porter) and accents folded, so "acquisitions" finds "acquisition" and "Zurich"
+## finds "Zürich".
+class SearchIndex(object):
+
+    def __init__(self, path=INDEX_PATH, fields=SEARCH_FIELDS):
+        self.path = path
+        self.fields = [field for field, weight in fields]
+        self.weights = [weight for field, weight in fields]
+        self.connection = sqlite3.connect(path)
+        try:
+            self.connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS lawyers USING fts5({}, tokenize='porter unicode61 "
+                "remove_diacritics 2')".format(", ".join(self.fields)))
+        except sqlite3.OperationalError as err:
+            self.connection.close()
+            raise RuntimeError('SearchIndex needs SQLite built with FTS5: {}'.format(err))
+        self.connection.execute("CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, url TEXT UNIQUE)")
+        self.connection.commit()
+
+    ## adds lawyers (lw_profile.Lawyer or dictionaries) to the index, replacing those already in it, in one transaction
+    def add(self, lawyers):
+        insert = "INSERT INTO lawyers (rowid, {}) VALUES (?, {})".format(
+            ", ".join(self.fields), ", ".join('?' for _ in self.fields))
+        try:
+            cursor = self.connection.cursor()
+            for lawyer in lawyers:
+                url = lawyer.get(lw_sinks.KEY)
+                cursor.execute("INSERT INTO documents (url) VALUES (?) ON CONFLICT (url) DO NOTHING", (url,))
+                document = cursor.execute("SELECT id FROM documents WHERE url = ?", (url,)).fetchone()[0]
+                cursor.execute("DELETE FROM lawyers WHERE rowid = ?", (document,))
+                cursor.execute(insert, [document] + [lawyer.get(field) or '' for field in self.fields])
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    ## takes the lawyers with these links out of the index
+    def remove(self, urls):
+        try:
+            cursor = self.connection.cursor()
+            for url in urls:
+                row = cursor.execute("SELECT id FROM documents WHERE url = ?", (url,)).fetchone()
+                if row is not None:
+                    cursor.execute("DELETE FROM lawyers WHERE rowid = ?", row)
+                    cursor.execute("DELETE FROM documents WHERE id = ?", row)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    ## merges the index's b-trees into one, which makes searches faster after many incremental adds
+    def optimize(self):
+        self.connection.execute("INSERT INTO lawyers (lawyers) VALUES ('optimize')")
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM documents").fetchone()[0]
+
+    ## Input: query in the FTS5 query syntax, e.g. 'merger* AND "private equity" NOT Location:Paris'. Terms that
+    ## aren't valid syntax, like M&A or cross-border, are searched for as phrases (quote_terms).
+    ## Output: list of at most limit Hits, best first
+    def search(self, query, limit=10, offset=0):
+        statement = """SELECT d.url, l.Name, l.Title, l.Location, bm25(lawyers, {}) AS score,
+  snippet(lawyers, -1, '[', ']', '...', 12)
+FROM lawyers l JOIN documents d ON d.id = l.rowid
+WHERE lawyers MATCH ?
+ORDER BY score
+LIMIT ? OFFSET ?""".format(", ".join(str(weight) for weight in self.weights))
+        try:
+            return [Hit(*row) for row in self.connection.execute(statement, (query, limit, offset))]
+        except sqlite3.OperationalError as err:
+            error = err
+        quoted = quote_terms(query, self.fields)
+        if quoted != query:
+            try:
+                return [Hit(*row) for row in self.connection.execute(statement, (quoted, limit, offset))]
+            except sqlite3.OperationalError:
+                pass
+        ## syntax errors the quoting doesn't fix, e.g. an unbalanced parenthesis or a dangling AND
+        raise ValueError('bad search query {!r}: {}'.format(query, error))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## keeps a SearchIndex up to date as lawyers are written: adds them commit_size at a time, removes lawyers that left
+## the directory and optimizes the index when closed
+class SearchIndexSink(lw_sinks.Sink):
+
+    def __init__(self, path=INDEX_PATH, commit_size=500):
+        self.index = SearchIndex(path)
+        self.commit_size = max(1, commit_size)
+        self.lawyers = []
+
+    def write(self, lawyer):
+        self.lawyers.append(lawyer)
+        if len(self.lawyers) >= self.commit_size:
+            self.flush()
+
+    def flush(self):
+        if self.lawyers:
+            self.index.add(self.lawyers)
+            self.lawyers = []
+
+    def remove(self, urls):
+        self.flush()
+        self.index.remove(urls)
+
+    def close(self):
+        self.flush()
+        self.index.optimize()
+        self.index.close()
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Searches the lawyers' biographies, experience and expertise indexed by the scraper "
+                    "(--search-index). Queries use the SQLite FTS5 syntax: keywords, \"exact phrases\", prefix*, "
+                    "AND/OR/NOT and column filters such as Location:London or Expertise:tax.")
+    parser.add_argument('query', nargs='?', help="what to search for")
+    parser.add_argument('--index', default=INDEX_PATH, help="search index file (default: {})".format(INDEX_PATH))
+    parser.add_argument('--limit', type=int, default=10, help="most results shown (default: 10)")
+    parser.add_argument('--build', metavar='JSONL',
+                        help="index the lawyers of this JSON lines file (e.g. LW_Lawyers.jsonl) first")
+    args = parser.parse_args()
+    if args.query is None and args.build is None:
+        parser.error('a query or --build is needed')
+
+    if args.build:
+        with SearchIndexSink(args.index) as sink, open(args.build) as lawyers:
+            for line in lawyers:
+                if line.strip():
+                    sink.write(json.loads(line))
+        with SearchIndex(args.index) as index:
+            print('Indexed {} lawyers in {}'.format(len(index), args.index))
+
+    if args.query is not None:
+        with SearchIndex(args.index) as index:
+            try:
+                hits = index.search(args.query, limit=args.limit)
+            except ValueError as err:
+                sys.exit(str(err))
+        for hit in hits:
+            print('{} - {}, {} ({:.2f})'.format(hit.name, hit.title, hit.location, -hit.score))
+            print('    {}'.format(hit.url))
+            print('    {}'.format(' '.join(hit.snippet.split())))
+        print('{} result{}'.format(len(hits), '' if len(hits) == 1 else 's'))
+#######################################################################################################################
+
+
+#######################################################################################################################
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,703 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - output sinks
+## Filename: lw_sinks.py
+##
+## Description:
+##          Sinks write lawyers (lw_profile.Lawyer) out one at a time as the
+##          scraper yields them, so nothing has to be held in memory and
+##          whatever was scraped before a crash is already on disk.
+##          DatabaseSink loads them straight into a database (SQLite out of
+##          the box, any DB-API 2.0 driver through DbAdapter) and
+##          ParquetSink writes columnar Parquet files for analytics.
+##
+##          with JsonLinesSink('LW_Lawyers.jsonl') as sink:
+##              for lawyer in lawyers:
+##                  sink.write(lawyer)
+##
+######################################################################################
+######################################################################################
+
+import os
+import glob
+import json
+import sqlite3
+
+import lw_profile
+
+## optional, only ParquetSink needs it. Imported the first time one is created, it is big to load for nothing
+pyarrow = None
+#######################################################################################################################
+#######################################################################################################################
+
+## name of the table lawyers are written to
+TABLE_NAME = 'L_W_Directory'
+
+## column identifying a lawyer when rows are upserted
+KEY = 'WebpageURL'
+
+
+## Base class of all sinks. Subclasses implement write() and, if they buffer, flush(). Sinks are context managers
+## that close themselves, flushing whatever is left, on the way out.
+class Sink(object):
+
+    def write(self, lawyer):
+        raise NotImplementedError
+
+    ## called with the links of lawyers no longer in the directory. Sinks that can delete rows do so
+    def remove(self, urls):
+        pass
+
+    def flush(self):
+        pass
+
+    ## Output: how many of the lawyers written last are not safely stored yet, even after flush() (e.g. rows of a
+    ## Parquet part file that isn't finished). A crash would lose them
+    def pending(self):
+        return 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## writes every lawyer to all of sinks
+class Tee(Sink):
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def write(self, lawyer):
+        for sink in self.sinks:
+            sink.write(lawyer)
+
+    def remove(self, urls):
+        for sink in self.sinks:
+            sink.remove(urls)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def pending(self):
+        return max([sink.pending() for sink in self.sinks] or [0])
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## lawyer (lw_profile.Lawyer or dictionary) as one line of JSON
+def json_line(lawyer):
+    if isinstance(lawyer, lw_profile.Lawyer):
+        return lawyer.to_json()
+    return json.dumps(lawyer)
+
+
+## Output: tuple of lawyer's (lw_profile.Lawyer or dictionary) values for columns
+def row_values(lawyer, columns):
+    if isinstance(lawyer, lw_profile.Lawyer):
+        return lawyer.row(columns)
+    return tuple(lawyer.get(column) for column in columns)
+
+
+## writes one JSON object per line (JSON Lines). Every line is flushed as it is written, so the file can be read
+## while the scraper is still running. append=True adds to an existing file instead of starting a new one. With keep
+## (a set of WebpageURLs, e.g. the lawyers a crawl checkpoint has as written) the existing file is first cut down to
+## the lawyers in keep, once each, so the ones a crashed run wrote after its last checkpoint aren't there twice once
+## they are written again.
+class JsonLinesSink(Sink):
+
+    def __init__(self, path, append=False, keep=None):
+        self.path = path
+        if append and keep is not None and os.path.exists(path):
+            self._keep_only(keep)
+        self.file = open(path, 'a' if append else 'w')
+
+    ## rewrites the file with only the first line of every lawyer in keep. A line cut short by a crash is dropped
+    def _keep_only(self, keep):
+        kept = set()
+        temp_path = self.path + '.tmp'
+        with open(self.path) as lines, open(temp_path, 'w') as out:
+            for line in lines:
+                try:
+                    url = json.loads(line).get(KEY)
+                except ValueError:
+                    continue
+                if url in keep and url not in kept:
+                    kept.add(url)
+                    out.write(line)
+        os.replace(temp_path, self.path)
+
+    def write(self, lawyer):
+        self.file.write(json_line(lawyer) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## returns value as an SQL literal. Single quotes/apostrophes are doubled to prevent unwanted escapes and None
+## renders as NULL
+def sql_literal(value):
+    if value is None:
+        return "NULL"
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+## SQL create table statement for table_name with a column for each of columns. With a key column the table is only
+## created if it doesn't exist yet and key is its primary key, so rows can be upserted into it.
+def create_table_sql(table_name, columns, key=None):
+    return ("""CREATE TABLE {}{} (
+  {}
+);
+
+""".format("IF NOT EXISTS " if key else "", table_name, (",\n  ".join(map(
+            lambda x: "{} VARCHAR(2000){}".format(x, " PRIMARY KEY" if x == key else ""), columns))))
+        )
+
+
+## ON CONFLICT clause turning an INSERT into an upsert on key (SQLite 3.24+, PostgreSQL 9.5+)
+def upsert_clause(columns, key):
+    return " ON CONFLICT ({}) DO UPDATE SET {}".format(
+        key, ", ".join("{0} = excluded.{0}".format(column) for column in columns if column != key))
+
+
+## INSERT statements for rows (each one "(value, value, ...)" of SQL literals), rows_per_insert rows per statement,
+## each followed by on_conflict
+def insert_statements(table_name, rows, rows_per_insert=1, on_conflict=""):
+    statements = []
+    for start in range(0, len(rows), rows_per_insert):
+        values = rows[start:start + rows_per_insert]
+        if len(values) == 1:
+            statements.append("\nINSERT INTO {} VALUES{}{};".format(table_name, values[0], on_conflict))
+        else:
+            statements.append("\nINSERT INTO {} VALUES\n{}{};".format(table_name, ",\n".join(values), on_conflict))
+    return "".join(statements)
+
+
+## Writes a .sql file: the CREATE TABLE statement first, then INSERT statements for the lawyers in batches of
+## batch_size. Every batch is flushed to disk as soon as it is full. rows_per_insert > 1 puts that many rows in a
+## single multi-row INSERT ... VALUES (...), (...); statement, which loads much faster. append=True skips the
+## CREATE TABLE statement and adds to an existing file. With an upsert_key the file updates an existing table
+## instead: CREATE TABLE IF NOT EXISTS, INSERT ... ON CONFLICT (upsert_key) DO UPDATE and DELETE for removed lawyers.
+## It also adds the unique index the upserts need, which a table created by a file without upsert_key lacks.
+class SqlFileSink(Sink):
+
+    def __init__(self, path, table_name=TABLE_NAME, columns=lw_profile.FIELDS, batch_size=100, rows_per_insert=1,
+                 append=False, upsert_key=None):
+        self.path = path
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.batch_size = max(batch_size, rows_per_insert)
+        self.rows_per_insert = max(1, rows_per_insert)
+        self.upsert_key = upsert_key
+        self.on_conflict = upsert_clause(self.columns, upsert_key) if upsert_key else ""
+        self.rows = []
+        self.file = open(path, 'a' if append else 'w')
+        if not append:
+            self.file.write(create_table_sql(table_name, self.columns, upsert_key))
+        if upsert_key:
+            ## the table may have been created without a key, e.g. by a full run or the run being resumed
+            self.file.write("\nCREATE UNIQUE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1});".format(table_name, upsert_key))
+        self.file.flush()
+
+    def write(self, lawyer):
+        self.rows.append("({})".format(",".join(sql_literal(value) for value in row_values(lawyer, self.columns))))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(insert_statements(self.table_name, self.rows, self.rows_per_insert, self.on_conflict))
+        self.rows = []
+        self.file.flush()
+
+    def remove(self, urls):
+        if not self.upsert_key or not urls:
+            return
+        self.flush()
+        self.file.write("".join("\nDELETE FROM {} WHERE {} = {};".format(self.table_name, self.upsert_key,
+                                                                          sql_literal(url)) for url in urls))
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## placeholder for each DB-API paramstyle, {0} being the position of the parameter
+PLACEHOLDERS = {
+    'qmark': '?',
+    'format': '%s',
+    'pyformat': '%s',
+    'numeric': ':{0}',
+    'named': ':p{0}',
+}
+
+
+## Connects DatabaseSink to a database through any DB-API 2.0 driver module, e.g.
+##     DbAdapter(psycopg2, 'dbname=lawyers user=scraper')
+## connect_args are passed to module.connect(). Subclasses can override the generated SQL for their engine.
+class DbAdapter(object):
+
+    def __init__(self, module, *connect_args, **connect_kwargs):
+        self.module = module
+        self.connect_args = connect_args
+        self.connect_kwargs = connect_kwargs
+
+    def connect(self):
+        return self.module.connect(*self.connect_args, **self.connect_kwargs)
+
+    def placeholder(self, position):
+        return PLACEHOLDERS[self.module.paramstyle].format(position)
+
+    ## Output: row of parameters (a tuple) as the driver takes it, a mapping for the named paramstyle
+    def parameters(self, row):
+        if self.module.paramstyle == 'named':
+            return dict(('p{}'.format(position + 1), value) for position, value in enumerate(row))
+        return row
+
+    def create_table_sql(self, table_name, columns):
+        return "CREATE TABLE IF NOT EXISTS {} ({})".format(
+            table_name, ", ".join("{} VARCHAR(2000)".format(column) for column in columns))
+
+    ## Output: names of the columns table_name has, read through cursor
+    def table_columns(self, cursor, table_name):
+        cursor.execute("SELECT * FROM {} WHERE 1 = 0".format(table_name))
+        columns = [description[0] for description in cursor.description]
+        cursor.fetchall()
+        return columns
+
+    def add_column_sql(self, table_name, column, column_type='VARCHAR(2000)'):
+        return "ALTER TABLE {} ADD COLUMN {} {}".format(table_name, column, column_type)
+
+    ## unique index needed to upsert on key. Also works on a table created before upserts were used
+    def unique_index_sql(self, table_name, key):
+        return "CREATE UNIQUE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})".format(table_name, key)
+
+    ## statement deleting all but the last row of every key of a table loaded before it had a unique index on key,
+    ## or None if the engine has no way to tell the copies apart
+    def dedupe_sql(self, table_name, key):
+        return None
+
+    def insert_sql(self, table_name, columns):
+        return "INSERT INTO {} ({}) VALUES ({})".format(
+            table_name, ", ".join(columns), ", ".join(self.placeholder(i + 1) for i in range(len(columns))))
+
+    def upsert_sql(self, table_name, columns, key):
+        return self.insert_sql(table_name, columns) + upsert_clause(columns, key)
+
+    def delete_sql(self, table_name, key):
+        return "DELETE FROM {} WHERE {} = {}".format(table_name, key, self.placeholder(1))
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## SQLite database file, nothing else to install. Uses write-ahead logging so the database can be queried while
+## the scraper is still loading it.
+class SqliteAdapter(DbAdapter):
+
+    def __init__(self, path):
+        DbAdapter.__init__(self, sqlite3, path)
+
+    def connect(self):
+        connection = DbAdapter.connect(self)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def dedupe_sql(self, table_name, key):
+        return "DELETE FROM {0} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {0} GROUP BY {1})".format(table_name, key)
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Loads lawyers straight into a database. Rows are buffered and inserted commit_size at a time with a single
+## parameterized executemany(), each batch in its own transaction: a failed batch is rolled back and the batches
+## before it stay committed. Lawyers already in the table are updated in place (upserted on upsert_key, None only
+## inserts) and remove() deletes lawyers no longer in the directory, so the same database can be loaded run after
+## run. Columns missing from an existing table (e.g. one created before ImagePath and ImageHash were added) are added
+## to it, and the copies of a lawyer a table loaded without upserts has are dropped, keeping the last one.
+class DatabaseSink(Sink):
+
+    def __init__(self, adapter, table_name=TABLE_NAME, columns=lw_profile.FIELDS, commit_size=500, upsert_key=KEY):
+        self.adapter = adapter
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.commit_size = max(1, commit_size)
+        self.upsert_key = upsert_key
+        self.rows = []
+        self.connection = adapter.connect()
+        if upsert_key:
+            self.insert = adapter.upsert_sql(table_name, self.columns, upsert_key)
+        else:
+            self.insert = adapter.insert_sql(table_name, self.columns)
+
+        cursor = self.connection.cursor()
+        cursor.execute(adapter.create_table_sql(table_name, self.columns))
+        self._add_missing_columns(cursor, 'VARCHAR(2000)')
+        if upsert_key:
+            dedupe = adapter.dedupe_sql(table_name, upsert_key)
+            if dedupe is not None:
+                cursor.execute(dedupe)
+            cursor.execute(adapter.unique_index_sql(table_name, upsert_key))
+        self.connection.commit()
+
+    ## adds the columns of self.columns that table_name doesn't have yet, as column_type
+    def _add_missing_columns(self, cursor, column_type):
+        existing = set(column.lower() for column in self.adapter.table_columns(cursor, self.table_name))
+        for column in self.columns:
+            if column.lower() not in existing:
+                cursor.execute(self.adapter.add_column_sql(self.table_name, column, column_type))
+
+    def write(self, lawyer):
+        self.rows.append(row_values(lawyer, self.columns))
+        if len(self.rows) >= self.commit_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        self._execute(self.insert, rows)
+
+    def remove(self, urls):
+        if not self.upsert_key or not urls:
+            return
+        self.flush()
+        self._execute(self.adapter.delete_sql(self.table_name, self.upsert_key), [(url,) for url in urls])
+
+    ## runs statement for every row of parameters in one transaction
+    def _execute(self, statement, rows):
+        self._execute_all([(statement, rows)])
+
+    ## runs each (statement, rows of parameters) in turn, all in one transaction
+    def _execute_all(self, batches):
+        try:
+            cursor = self.connection.cursor()
+            for statement, rows in batches:
+                if rows:
+                    cursor.executemany(statement, [self.adapter.parameters(row) for row in rows])
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.flush()
+            finally:
+                self.connection.close()
+                self.connection = None
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## fields holding several values joined with SEPARATOR. The normalized schema gives each of them a child table
+MULTI_VALUED = ['Education', 'Expertise', 'AdmissionsQualifications', 'NewsEvents', 'Publications', 'Distinctions']
+SEPARATOR = '; '
+
+## indexes of the normalized schema's main table: lookups by name, and by office (and title within an office).
+## Practice areas are looked up through the index on the Expertise child table's values
+INDEXES = [['Name'], ['Location', 'Title']]
+
+
+## Layout of the normalized tables: the main table_name holds the single valued fields as TEXT, key is its primary
+## key, and every multi_valued field gets a child table <table_name>_<field> (key, Position, Value) with a row per
+## value, in order, and an index on Value. So "all M&A partners in London" is a couple of index lookups:
+##     SELECT d.Name FROM L_W_Directory d JOIN L_W_Directory_Expertise e ON e.WebpageURL = d.WebpageURL
+##     WHERE e.Value = 'Mergers & Acquisitions' AND d.Location = 'London' AND d.Title = 'Partner'
+class NormalizedSchema(object):
+
+    def __init__(self, table_name=TABLE_NAME, columns=lw_profile.FIELDS, key=KEY, multi_valued=MULTI_VALUED,
+                 indexes=INDEXES):
+        self.table_name = table_name
+        self.key = key
+        self.columns = [column for column in columns if column not in multi_valued]
+        self.children = [(self.child_table(field), field) for field in multi_valued if field in columns]
+        self.indexes = [index for index in indexes if all(column in self.columns for column in index)]
+
+    def child_table(self, field):
+        return '{}_{}'.format(self.table_name, field)
+
+    ## Output: list of the statements creating the tables and indexes, if they don't exist yet
+    def create_sql(self):
+        statements = ["CREATE TABLE IF NOT EXISTS {} (\n  {}\n)".format(self.table_name, ",\n  ".join(
+            "{} TEXT{}".format(column, " NOT NULL PRIMARY KEY" if column == self.key else "")
+            for column in self.columns))]
+        for index in self.indexes:
+            statements.append("CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({2})".format(
+                self.table_name, "_".join(index), ", ".join(index)))
+        for child, field in self.children:
+            statements.append(("CREATE TABLE IF NOT EXISTS {0} (\n  {1} TEXT NOT NULL REFERENCES {2} ({1}) ON DELETE "
+                               "CASCADE,\n  Position INTEGER NOT NULL,\n  Value TEXT NOT NULL,\n  PRIMARY KEY ({1}, "
+                               "Position)\n)").format(child, self.key, self.table_name))
+            statements.append("CREATE INDEX IF NOT EXISTS {0}_Value ON {0} (Value, {1})".format(child, self.key))
+        return statements
+
+    ## Output: (tuple of lawyer's values for the main table, {child table: [(key, position, value), ...]})
+    def rows(self, lawyer):
+        url = lawyer.get(self.key)
+        children = {}
+        for child, field in self.children:
+            values = [value.strip() for value in (lawyer.get(field) or '').split(SEPARATOR)]
+            children[child] = [(url, position, value) for position, value in enumerate(v for v in values if v)]
+        return row_values(lawyer, self.columns), children
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## SqlFileSink for the normalized schema (NormalizedSchema): the file creates the tables and indexes if they don't
+## exist, upserts every lawyer on the schema's key and replaces their rows in the child tables, so it can be loaded
+## into the same database again and again. remove() deletes lawyers with their child rows.
+class NormalizedSqlFileSink(SqlFileSink):
+
+    def __init__(self, path, schema=None, batch_size=100, rows_per_insert=1, append=False):
+        self.schema = schema if schema is not None else NormalizedSchema()
+        SqlFileSink.__init__(self, path, self.schema.table_name, self.schema.columns, batch_size, rows_per_insert,
+                             append=True, upsert_key=self.schema.key)
+        self.children = [child for child, field in self.schema.children]
+        self.lawyers = []
+        if not append:
+            self.file.seek(0)
+            self.file.truncate()
+            self.file.write("".join(statement + ";\n\n" for statement in self.schema.create_sql()))
+            self.file.flush()
+
+    def write(self, lawyer):
+        self.lawyers.append(lawyer)
+        if len(self.lawyers) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.lawyers:
+            return
+        ## the last of a lawyer written twice in the batch wins, its child rows would clash otherwise
+        lawyers = dict((lawyer.get(self.schema.key), lawyer) for lawyer in self.lawyers)
+        self.lawyers = []
+
+        rows = []
+        children = dict((child, []) for child in self.children)
+        for lawyer in lawyers.values():
+            row, values = self.schema.rows(lawyer)
+            rows.append("({})".format(",".join(sql_literal(value) for value in row)))
+            for child, child_rows in values.items():
+                children[child].extend("({},{},{})".format(sql_literal(url), position, sql_literal(value))
+                                       for url, position, value in child_rows)
+
+        statements = [insert_statements(self.table_name, rows, self.rows_per_insert, self.on_conflict)]
+        statements.extend(self._delete_children([sql_literal(url) for url in lawyers]))
+        for child, child_rows in children.items():
+            statements.append(insert_statements(child, child_rows, self.rows_per_insert))
+        self.file.write("".join(statements))
+        self.file.flush()
+
+    def _delete_children(self, urls):
+        return ["\nDELETE FROM {} WHERE {} IN ({});".format(child, self.schema.key, ", ".join(urls))
+                for child in self.children]
+
+    def remove(self, urls):
+        if not urls:
+            return
+        self.flush()
+        literals = [sql_literal(url) for url in urls]
+        statements = self._delete_children(literals)
+        statements.append("\nDELETE FROM {} WHERE {} IN ({});".format(self.table_name, self.schema.key,
+                                                                      ", ".join(literals)))
+        self.file.write("".join(statements))
+        self.file.flush()
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## DatabaseSink for the normalized schema (NormalizedSchema): creates the tables and indexes if they don't exist,
+## upserts every lawyer on the schema's key and replaces their rows in the child tables, each batch of lawyers with
+## their child rows in one transaction. remove() deletes lawyers with their child rows. Columns missing from an
+## existing main table are added to it.
+class NormalizedDatabaseSink(DatabaseSink):
+
+    def __init__(self, adapter, schema=None, commit_size=500):
+        self.adapter = adapter
+        self.schema = schema if schema is not None else NormalizedSchema()
+        self.table_name = self.schema.table_name
+        self.columns = self.schema.columns
+        self.commit_size = max(1, commit_size)
+        self.upsert_key = self.schema.key
+        self.rows = []
+        self.connection = adapter.connect()
+        self.insert = adapter.upsert_sql(self.table_name, self.columns, self.upsert_key)
+
+        cursor = self.connection.cursor()
+        for statement in self.schema.create_sql():
+            cursor.execute(statement)
+        self._add_missing_columns(cursor, 'TEXT')
+        self.connection.commit()
+
+    def write(self, lawyer):
+        self.rows.append(lawyer)
+        if len(self.rows) >= self.commit_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        ## the last of a lawyer written twice in the batch wins, its child rows would clash otherwise
+        lawyers = dict((lawyer.get(self.upsert_key), lawyer) for lawyer in self.rows)
+        self.rows = []
+
+        rows = []
+        children = dict((child, []) for child, field in self.schema.children)
+        for lawyer in lawyers.values():
+            row, values = self.schema.rows(lawyer)
+            rows.append(row)
+            for child, child_rows in values.items():
+                children[child].extend(child_rows)
+
+        urls = [(url,) for url in lawyers]
+        batches = [(self.insert, rows)]
+        for child, child_rows in children.items():
+            batches.append((self.adapter.delete_sql(child, self.upsert_key), urls))
+            batches.append((self.adapter.insert_sql(child, [self.upsert_key, 'Position', 'Value']), child_rows))
+        self._execute_all(batches)
+
+    def remove(self, urls):
+        if not urls:
+            return
+        self.flush()
+        rows = [(url,) for url in urls]
+        batches = [(self.adapter.delete_sql(child, self.upsert_key), rows) for child, field in self.schema.children]
+        batches.append((self.adapter.delete_sql(self.table_name, self.upsert_key), rows))
+        self._execute_all(batches)
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## columns with few distinct values, stored dictionary encoded: each distinct value once plus a small index per row
+DICTIONARY_COLUMNS = ['Company', 'Title', 'Location', 'Timestamp']
+
+## compression codecs ParquetSink can use
+COMPRESSIONS = ['zstd', 'snappy', 'gzip', 'none']
+
+
+## Writes lawyers as Parquet, a columnar format analytics tools (pandas, DuckDB, Spark, ...) can read a few columns
+## of without parsing the rest. path is a folder of part files, read together as one dataset, e.g.
+## pyarrow.parquet.read_table(path, columns=['Name', 'Location']). Rows are buffered column by column and streamed
+## out as row groups of row_group_size rows, compressed with compression; the dictionary_columns are dictionary
+## encoded and come back as categoricals. A Parquet file only becomes readable once it is finished and can't be added
+## to after that, so every row_groups_per_part row groups finish a part file and the next rows go to a new one; the
+## last part is finished by close(). flush() leaves rows buffered until they make a full row group, and pending()
+## counts the rows not in a finished part yet. append=True adds parts to the folder instead of starting it over.
+## Parts are written as _part-NNNNN.parquet.tmp until they are finished (readers of the folder skip names starting
+## with _), and the ones a crash left behind are deleted. Needs pyarrow (pip install pyarrow).
+class ParquetSink(Sink):
+
+    def __init__(self, path, columns=lw_profile.FIELDS, row_group_size=10000, compression='zstd',
+                 dictionary_columns=DICTIONARY_COLUMNS, append=False, row_groups_per_part=10):
+        global pyarrow
+        if pyarrow is None:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError('ParquetSink needs pyarrow: pip install pyarrow')
+
+        self.path = path
+        self.columns = list(columns)
+        self.row_group_size = row_group_size
+        self.row_groups_per_part = max(1, row_groups_per_part)
+        self.compression = compression
+        self.dictionary_columns = [column for column in dictionary_columns if column in self.columns]
+        self.schema = pyarrow.schema([
+            (column, pyarrow.dictionary(pyarrow.int32(), pyarrow.string()) if column in self.dictionary_columns
+             else pyarrow.string()) for column in self.columns])
+
+        os.makedirs(path, exist_ok=True)
+        ## unfinished parts of a run that crashed. They can't be read, their rows are written again
+        for temp_path in glob.glob(os.path.join(path, '_part-*.parquet.tmp')) + glob.glob(
+                os.path.join(path, 'part-*.parquet.tmp')):
+            os.remove(temp_path)
+        parts = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+        if not append:
+            for part in parts:
+                os.remove(part)
+            parts = []
+        self._next_part = int(os.path.basename(parts[-1])[5:-8]) + 1 if parts else 0
+        self._buffer = dict((column, []) for column in self.columns)
+        self._buffered = 0
+        self._writer = None
+        self._part_path = None
+        ## row groups and rows in the part being written
+        self._part_row_groups = 0
+        self._part_rows = 0
+
+    def write(self, lawyer):
+        for column, value in zip(self.columns, row_values(lawyer, self.columns)):
+            self._buffer[column].append(value if value is None else str(value))
+        self._buffered += 1
+        if self._buffered >= self.row_group_size:
+            self._write_row_group()
+
+    def _temp_path(self):
+        return os.path.join(self.path, '_' + os.path.basename(self._part_path) + '.tmp')
+
+    def _write_row_group(self):
+        if not self._buffered:
+            return
+        if self._writer is None:
+            self._part_path = os.path.join(self.path, 'part-{:05d}.parquet'.format(self._next_part))
+            self._next_part += 1
+            self._writer = pyarrow.parquet.ParquetWriter(
+                self._temp_path(), self.schema, compression=self.compression,
+                use_dictionary=self.dictionary_columns or False)
+        table = pyarrow.Table.from_pydict(self._buffer, schema=self.schema)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._part_row_groups += 1
+        self._part_rows += self._buffered
+        self._buffer = dict((column, []) for column in self.columns)
+        self._buffered = 0
+        if self._part_row_groups >= self.row_groups_per_part:
+            self._finish_part()
+
+    def _finish_part(self):
+        if self._writer is not None:
+            self._writer.close()
+            os.replace(self._temp_path(), self._part_path)
+            self._writer = None
+            self._part_row_groups = 0
+            self._part_rows = 0
+
+    def pending(self):
+        return self._part_rows + self._buffered
+
+    ## writes out the buffered rows and finishes the current part file
+    def close(self):
+        self._write_row_group()
+        self._finish_part()
+#######################################################################################################################
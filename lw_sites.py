@@ -0,0 +1,420 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - many firm directories at once
+## Filename: lw_sites.py
+##
+## Description:
+##          Crawls the lawyer directories of any number of firms, each
+##          described by a site profile (sites/*.json): where its directory
+##          pages are, which links on them lead to lawyers, and which CSS
+##          selectors on a lawyer's page give which field. All sites share
+##          one pool of worker threads and one http connection pool; every
+##          site keeps its own rate limit, and a site that is waiting for its
+##          limit never holds up the others, so the crawl gets faster with
+##          every site added. Each site is written to its own files/table.
+##
+##          python lw_sites.py sites/*.json --letters all --out LW_Sites
+##
+##          Directories behind postbacks (like the Latham & Watkins letter
+##          pages) can't be listed over plain http; sites/example.json
+##          works with bench/fake_directory.py.
+##
+######################################################################################
+######################################################################################
+
+import os
+import sys
+import json
+import time
+import queue
+import string
+import argparse
+import datetime
+import threading
+from collections import deque
+from urllib.parse import urljoin
+
+import soupsieve
+
+import lw_fetch
+import lw_sinks
+import lw_metrics
+import lw_profile
+import lw_pipeline
+#######################################################################################################################
+#######################################################################################################################
+
+## fields the scheduler fills in itself, a site profile can't select them
+SET_BY_SCHEDULER = ['Company', 'WebpageURL', 'Timestamp', 'ImagePath', 'ImageHash']
+
+
+## How to get one field out of a lawyer's page: the elements matching the CSS selector select, their text (or their
+## attr attribute) stripped, without the values in exclude, made absolute urls if absolute, reduced to ascii if ascii.
+## join glues all of them together with it; without join only the first one is used.
+class FieldSpec(object):
+
+    def __init__(self, select, attr=None, join=None, exclude=(), absolute=False, ascii=False):
+        self.selector = soupsieve.compile(select)
+        self.attr = attr
+        self.join = join
+        self.exclude = set(exclude)
+        self.absolute = absolute
+        self.ascii = ascii
+
+    ## Output: value of the field on soup, the page at url, or None if it isn't there
+    def extract(self, soup, url):
+        elements = self.selector.select(soup) if self.join is not None else [self.selector.select_one(soup)]
+        values = []
+        for element in elements:
+            if element is None:
+                continue
+            value = element.get(self.attr) if self.attr else element.get_text(" ", strip=True)
+            if not value or value in self.exclude:
+                continue
+            if self.absolute:
+                value = urljoin(url, value)
+            if self.ascii:
+                value = lw_profile._ascii(value)
+            values.append(value.strip())
+        if not values:
+            return None
+        return self.join.join(values) if self.join is not None else values[0]
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## A firm's directory, from its site profile (the dictionary loaded from sites/<name>.json):
+##     name, company, domain       short name of the site (used for its output files), firm name, site root url
+##     table_name                  table its lawyers are written to (default: <name>)
+##     rate                        optional {"max_per_host": N, "delay": SECONDS} for this site's host
+##     directory.pages             directory page paths/urls; {letter} in one is replaced by each of the letters
+##     directory.links             CSS selector of the links to lawyers' pages on a directory page
+##     directory.link_contains     optional text a lawyer link must contain
+##     directory.next              optional CSS selector of the link to the next directory page
+##     profile.required            optional CSS selector of an element every lawyer's page has
+##     profile.fields              {field: {"select": ..., FieldSpec options}} for fields of lw_profile.FIELDS
+## A profile that doesn't fit raises ValueError.
+class SiteProfile(object):
+
+    def __init__(self, config):
+        try:
+            self.name = config['name']
+            self.company = config['company']
+            self.domain = config['domain'].rstrip('/')
+            self.table_name = config.get('table_name', self.name)
+            rate = config.get('rate', {})
+            self.max_per_host = rate.get('max_per_host')
+            self.delay = rate.get('delay')
+
+            directory = config['directory']
+            self.pages = list(directory['pages'])
+            self.links = soupsieve.compile(directory['links'])
+            self.link_contains = directory.get('link_contains')
+            self.next = soupsieve.compile(directory['next']) if directory.get('next') else None
+
+            profile = config['profile']
+            self.required = soupsieve.compile(profile['required']) if profile.get('required') else None
+            self.fields = []
+            for field, spec in profile['fields'].items():
+                if field not in lw_profile.FIELDS or field in SET_BY_SCHEDULER:
+                    raise ValueError('unknown field ' + field)
+                self.fields.append((field, FieldSpec(**spec)))
+        except (KeyError, TypeError, ValueError, soupsieve.SelectorSyntaxError) as err:
+            raise ValueError('bad site profile {}: {}'.format(config.get('name', '?'),
+                                                                 str(err).strip().splitlines()[0]))
+
+    ## Output: the directory pages' urls, one per letter for pages with {letter}
+    def directory_pages(self, letters=string.ascii_uppercase):
+        urls = []
+        for page in self.pages:
+            for letter in (letters if '{letter}' in page else [None]):
+                urls.append(urljoin(self.domain + '/', page.format(letter=letter) if letter else page))
+        return urls
+
+    ## Output: (lawyer links, next directory page or None) found on a directory page's html
+    def parse_directory(self, html, url, parser='html.parser'):
+        soup = lw_profile.make_soup(html, parser)
+        links = []
+        for link in self.links.select(soup):
+            href = link.get('href')
+            if href and (self.link_contains is None or self.link_contains in href):
+                links.append(urljoin(url, href))
+        next_link = self.next.select_one(soup) if self.next is not None else None
+        return links, urljoin(url, next_link['href']) if next_link is not None and next_link.get('href') else None
+
+    ## Output: lw_profile.Lawyer from a lawyer's page, or None if the page has no lawyer on it
+    def parse_profile(self, html, url, parser='html.parser'):
+        soup = lw_profile.make_soup(html, parser)
+        if self.required is not None and self.required.select_one(soup) is None:
+            return None
+        lawyer = lw_profile.Lawyer(Company=self.company, WebpageURL=url,
+                                   Timestamp=datetime.datetime.today().strftime("%Y-%b-%d"))
+        for field, spec in self.fields:
+            lawyer[field] = spec.extract(soup, url)
+        return lawyer
+
+
+def load_site(path):
+    with open(path) as profile:
+        return SiteProfile(json.load(profile))
+
+
+## Output: SiteProfile of every file of paths, names checked to be unique
+def load_sites(paths):
+    sites = [load_site(path) for path in paths]
+    names = [site.name for site in sites]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError('site names used twice: ' + ', '.join(duplicates))
+    return sites
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+## Crawls sites (SiteProfiles) together and yields (site, lw_profile.Lawyer) as lawyers are scraped, in no particular
+## order. Every site lists its directory in a thread of its own. The lawyer pages of all sites are fetched by the same
+## workers threads over one http connection pool and parsed by parse_workers threads, through a
+## lw_pipeline.Pipeline. Rates are limited per site by one lw_fetch.AdaptiveLimiter (max_per_host and delay, or the
+## site profile's own rate): a page is only handed to a worker once its site's limit lets it start, the sites taking
+## turns, so workers never sit waiting on a slow site while another could go. A page that fails is retried up to
+## retries times; throttled pages wait for their site's pause without taking a worker.
+class Scheduler(object):
+
+    def __init__(self, sites, workers=None, parse_workers=2, max_per_host=4, delay=0.0, queue_size=64,
+                 letters=string.ascii_uppercase, parser='html.parser', retries=2, timeout=10, metrics=None):
+        self.sites = list(sites)
+        self.max_per_host = max_per_host
+        ## enough workers for every site to have its limit in flight
+        self.workers = workers or sum(site.max_per_host or max_per_host for site in self.sites)
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.letters = letters
+        self.parser = parser
+        self.retries = retries
+        self.timeout = timeout
+        self.metrics = metrics if metrics is not None else lw_metrics.Metrics()
+        self.limiter = lw_fetch.AdaptiveLimiter(max_per_host=max_per_host, min_interval=delay, metrics=self.metrics)
+        for site in self.sites:
+            self.limiter.configure(site.domain, site.max_per_host, site.delay)
+        ## lawyers scraped and pages failed, per site name
+        self.counts = dict((site.name, {'lawyers': 0, 'failures': 0}) for site in self.sites)
+        self._lock = threading.Lock()
+
+    def _count(self, site, counter):
+        with self._lock:
+            self.counts[site.name][counter] += 1
+        self.metrics.count(counter if counter != 'lawyers' else 'records')
+
+    ## GETs url within its site's rate limit, already acquired from the limiter at started. The latency reported to
+    ## the limiter is timed from here, the time the page waited for a worker doesn't count.
+    ## Output: html of the page
+    def _get(self, session, url, started):
+        start = time.monotonic()
+        try:
+            with self.metrics.timer('fetch'):
+                response = session.get(url, timeout=self.limiter.timeout(url, self.timeout))
+                if response.status_code in (429, 503):
+                    raise lw_fetch.Throttled(url, response.status_code,
+                                             lw_fetch.retry_after_seconds(response.headers.get('Retry-After')))
+                response.raise_for_status()
+        except Exception as err:
+            self.limiter.release(url, error=err, started=started)
+            raise
+        self.limiter.release(url, latency=time.monotonic() - start, started=started)
+        self.metrics.count('pages')
+        self.metrics.count('bytes', len(response.content))
+        return response.text
+
+    ## lists site's directory pages, putting every new lawyer link on links. None goes on once the site is done
+    def _discover(self, site, session, links):
+        seen = set()
+        try:
+            for page in site.directory_pages(self.letters):
+                while page is not None and page not in seen:
+                    seen.add(page)
+                    try:
+                        with self.limiter.slot(page, lw_fetch.LISTING), self.metrics.timer('letter'):
+                            response = session.get(page, timeout=self.limiter.timeout(page, self.timeout,
+                                                                                       lw_fetch.LISTING))
+                            response.raise_for_status()
+                        found, page = site.parse_directory(response.text, response.url, self.parser)
+                    except Exception as err:
+                        print('Failed to list ' + site.name + ' ' + page + ': ' + str(err).strip())
+                        break
+                    for link in found:
+                        if link not in seen:
+                            seen.add(link)
+                            links.put(link)
+        finally:
+            links.put(None)
+
+    ## pipeline source: the sites' lawyer links, each one handed out once its site's rate limit let it start.
+    ## Output: (site, link, attempt, time it started)
+    def _admit(self, session, stop):
+        pending = []
+        for site in self.sites:
+            links = queue.Queue(self.queue_size)
+            thread = threading.Thread(target=self._discover, args=(site, session, links),
+                                      name='discover-' + site.name)
+            thread.daemon = True
+            thread.start()
+            ## [site, listed links, links to retry, next link and its attempt, listing finished]
+            pending.append([site, links, self._retry[site.name], None, False])
+
+        while pending and not stop.is_set():
+            started_any = False
+            for entry in list(pending):
+                site, links, retry, waiting, listed = entry
+                if waiting is None:
+                    if retry:
+                        waiting = retry.popleft()
+                    elif not listed:
+                        try:
+                            link = links.get_nowait()
+                        except queue.Empty:
+                            link = False
+                        if link is None:
+                            entry[4] = listed = True
+                        elif link:
+                            waiting = (link, 1)
+                    entry[3] = waiting
+                if waiting is None:
+                    ## done once listed and nothing is left to retry or in flight
+                    if listed and not retry and self._in_flight[site.name] == 0:
+                        pending.remove(entry)
+                    continue
+                if self.limiter.try_acquire(waiting[0]):
+                    entry[3] = None
+                    with self._lock:
+                        self._in_flight[site.name] += 1
+                    started_any = True
+                    yield site, waiting[0], waiting[1], time.monotonic()
+            if not started_any:
+                self.limiter.wait(0.02)
+
+    ## Output: (site, link, html) of a page, or lw_pipeline.SKIP if it failed (it is queued again if it may retry)
+    def _fetch(self, session, item):
+        site, link, attempt, started = item
+        try:
+            return site, link, self._get(session, link, started)
+        except Exception as err:
+            print('Failed to scrape ' + link + ': ' + str(err).strip())
+            if attempt <= self.retries:
+                self.metrics.count('retries')
+                self._retry[site.name].append((link, attempt + 1))
+            else:
+                self._count(site, 'failures')
+            return lw_pipeline.SKIP
+        finally:
+            with self._lock:
+                self._in_flight[site.name] -= 1
+
+    ## Output: (site, Lawyer), or lw_pipeline.SKIP if the page has no lawyer on it or can't be parsed
+    def _parse(self, fetched):
+        site, link, html = fetched
+        try:
+            with self.metrics.timer('parse'):
+                lawyer = site.parse_profile(html, link, self.parser)
+        except Exception as err:
+            print('Failed to scrape ' + link + ': ' + str(err).strip())
+            lawyer = None
+        if lawyer is None:
+            self._count(site, 'failures')
+            return lw_pipeline.SKIP
+        self._count(site, 'lawyers')
+        return site, lawyer
+
+    def __iter__(self):
+        self._retry = dict((site.name, deque()) for site in self.sites)
+        self._in_flight = dict((site.name, 0) for site in self.sites)
+        stop = threading.Event()
+        session = lw_fetch.http_session(pool_size=max(self.workers, len(self.sites)))
+        stages = [lw_pipeline.Stage('fetch', lambda item: self._fetch(session, item), self.workers),
+                  lw_pipeline.Stage('parse', self._parse, self.parse_workers)]
+        try:
+            for result in lw_pipeline.Pipeline(self._admit(session, stop), stages, queue_size=self.queue_size,
+                                               ordered=False):
+                yield result
+        finally:
+            stop.set()
+            session.close()
+
+    ## one line per site, for printing at the end of a run
+    def summary(self):
+        return '\n'.join('{}: {lawyers} lawyers, {failures} failed'.format(name, **counts)
+                         for name, counts in sorted(self.counts.items()))
+#######################################################################################################################
+
+
+#######################################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrapes the lawyer directories of the firms described by site "
+                                                 "profiles, all at the same time.")
+    parser.add_argument('sites', nargs='+', metavar='PROFILE', help="site profiles, e.g. sites/*.json")
+    parser.add_argument('--letters', default='all',
+                        help="letters for directory pages with {letter}, e.g. ABC, or 'all' (default: all)")
+    parser.add_argument('--workers', type=int,
+                        help="lawyer pages fetched at the same time over all sites (default: enough for every "
+                             "site's limit)")
+    parser.add_argument('--parse-workers', type=int, default=2, help="pages parsed at the same time (default: 2)")
+    parser.add_argument('--max-per-host', type=int, default=4,
+                        help="most requests in flight per site, unless its profile says otherwise (default: 4)")
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help="least seconds between two requests to a site, unless its profile says otherwise "
+                             "(default: 0)")
+    parser.add_argument('--queue-size', type=int, default=64, help="most pages waiting between stages (default: 64)")
+    parser.add_argument('--parser', default='html.parser', help="BeautifulSoup parser (default: html.parser)")
+    parser.add_argument('--retries', type=int, default=2, help="times a failed page is retried (default: 2)")
+    parser.add_argument('--out', metavar='DIR', default='LW_Sites',
+                        help="folder of the <site>.jsonl and <site>.sql files (default: LW_Sites)")
+    parser.add_argument('--db', metavar='PATH', help="also load every site into its table of this SQLite database")
+    parser.add_argument('--report', metavar='PATH', default='LW_Sites_Report.json',
+                        help="where the run report is written (default: LW_Sites_Report.json)")
+    args = parser.parse_args()
+
+    try:
+        sites = load_sites(args.sites)
+    except (OSError, ValueError) as err:
+        sys.exit(str(err))
+
+    metrics = lw_metrics.Metrics()
+    scheduler = Scheduler(sites, workers=args.workers, parse_workers=args.parse_workers,
+                          max_per_host=args.max_per_host, delay=args.delay, queue_size=args.queue_size,
+                          letters=string.ascii_uppercase if args.letters.lower() == 'all' else args.letters.upper(),
+                          parser=args.parser, retries=args.retries, metrics=metrics)
+
+    ## every site is written to its own files and table
+    os.makedirs(args.out, exist_ok=True)
+    sinks = {}
+    for site in sites:
+        site_sinks = [lw_sinks.JsonLinesSink(os.path.join(args.out, site.name + '.jsonl')),
+                      lw_sinks.SqlFileSink(os.path.join(args.out, site.name + '.sql'), table_name=site.table_name,
+                                           rows_per_insert=100)]
+        if args.db:
+            site_sinks.append(lw_sinks.DatabaseSink(lw_sinks.SqliteAdapter(args.db), table_name=site.table_name))
+        sinks[site.name] = lw_sinks.Tee(site_sinks)
+
+    try:
+        for site, lawyer in scheduler:
+            with metrics.timer('write'):
+                sinks[site.name].write(lawyer)
+    finally:
+        for sink in sinks.values():
+            sink.close()
+
+    print(scheduler.summary())
+    print(scheduler.limiter.summary())
+    print(metrics.summary())
+    metrics.write_json(args.report, sites=scheduler.counts, hosts=scheduler.limiter.stats(),
+                       options=vars(args))
+    print('Run report written to ' + args.report)
+#######################################################################################################################
+
+
+#######################################################################################################################
+if __name__ == '__main__':
+    main()
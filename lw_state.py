@@ -0,0 +1,158 @@
+######################################################################################
+######################################################################################
+##
+## Latham & Watkins directory WebsScraping - incremental re-scrape state
+## Filename: lw_state.py
+##
+## Description:
+##          Remembers, for every lawyer's webpage (keyed on WebpageURL),
+##          the content hash of its RightColumnMainContent and the ETag /
+##          Last-Modified headers it was served with. The next run uses them
+##          to skip pages that haven't changed, and to report which lawyers
+##          are new, changed, unchanged or gone from the directory.
+##
+######################################################################################
+######################################################################################
+
+import string
+import sqlite3
+import datetime
+import threading
+from collections import namedtuple
+#######################################################################################################################
+#######################################################################################################################
+
+NEW = 'new'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+REMOVED = 'removed'
+
+## what is known about a lawyer's webpage from the last time it was scraped
+Known = namedtuple('Known', ['content_hash', 'etag', 'last_modified'])
+
+
+## State kept in a small SQLite file between runs. Every run starts by loading the known pages into memory, then
+## records what each page turned out to be (record()) and finally marks the pages that weren't seen this time as
+## removed (finish()). Every page also keeps the directory letters it is listed under, so a run over some of the
+## letters only removes lawyers of those letters. Records are held in memory until commit(), which the caller makes
+## once the lawyers recorded are safely written out: a crash before that scrapes them again instead of taking them as
+## unchanged. Safe to use from several worker threads.
+class StateStore(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.counts = dict.fromkeys([NEW, CHANGED, UNCHANGED, REMOVED], 0)
+        self._lock = threading.Lock()
+        self._seen = set()
+        ## url: row recorded but not committed yet
+        self._unsaved = {}
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS profiles (
+  url TEXT PRIMARY KEY,
+  content_hash TEXT,
+  etag TEXT,
+  last_modified TEXT,
+  last_seen TEXT,
+  removed INTEGER NOT NULL DEFAULT 0,
+  letters TEXT
+)""")
+        ## state files from before letters were kept. Their pages' letters are unknown until the next run lists them
+        if 'letters' not in [column[1] for column in self.connection.execute("PRAGMA table_info(profiles)")]:
+            self.connection.execute("ALTER TABLE profiles ADD COLUMN letters TEXT")
+        self.connection.commit()
+
+        self._known = {}
+        self._letters = {}
+        for url, content_hash, etag, last_modified, letters in self.connection.execute(
+                "SELECT url, content_hash, etag, last_modified, letters FROM profiles WHERE removed = 0"):
+            self._known[url] = Known(content_hash, etag, last_modified)
+            self._letters[url] = letters
+
+    ## Output: Known for url, or None if url was never scraped (or was removed from the directory since)
+    def get(self, url):
+        with self._lock:
+            return self._known.get(url)
+
+    ## records the outcome of scraping url and counts it as NEW, CHANGED or UNCHANGED.
+    ## Input: url, its status and the Known content hash/validators it came with. The validators of an unchanged
+    ## page are kept if the server didn't send new ones.
+    def record(self, url, status, known):
+        with self._lock:
+            self.counts[status] += 1
+            self._seen.add(url)
+
+            previous = self._known.get(url)
+            if status == UNCHANGED and previous is not None:
+                known = Known(known.content_hash or previous.content_hash, known.etag or previous.etag,
+                              known.last_modified or previous.last_modified)
+            self._known[url] = known
+            self._unsaved[url] = (known, datetime.date.today().isoformat())
+
+    ## saves what was recorded, to be called once the sinks have flushed the lawyers recorded. The records of the
+    ## urls in hold (lawyers the sinks don't have safely stored yet) wait for a later commit()
+    def commit(self, hold=()):
+        with self._lock:
+            hold = set(hold)
+            rows = [(url, known.content_hash, known.etag, known.last_modified, last_seen, self._letters.get(url))
+                    for url, (known, last_seen) in self._unsaved.items() if url not in hold]
+            self.connection.executemany(
+                "INSERT INTO profiles (url, content_hash, etag, last_modified, last_seen, removed, letters) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?) ON CONFLICT (url) DO UPDATE SET content_hash = excluded.content_hash, "
+                "etag = excluded.etag, last_modified = excluded.last_modified, last_seen = excluded.last_seen, "
+                "removed = 0, letters = COALESCE(excluded.letters, letters)", rows)
+            self.connection.commit()
+            self._unsaved = dict((url, row) for url, row in self._unsaved.items() if url in hold)
+
+    ## counts url as seen without changing what is known about it, e.g. for a page that couldn't be scraped this time
+    def keep(self, url):
+        with self._lock:
+            self._seen.add(url)
+
+    ## to be called once every page listed has been scraped. Input: listed, {letter: links of its lawyers} for every
+    ## letter of the directory fully listed in this run, None if all of them were. Saves the letters each page is
+    ## listed under and marks every known page that wasn't seen in this run as removed, if all the letters it was
+    ## listed under were listed this time. A page whose letters aren't known yet is only removed when every letter
+    ## was listed.
+    ## Output: list of links of the removed pages
+    def finish(self, listed=None):
+        with self._lock:
+            letters = set(listed) if listed is not None else set(string.ascii_uppercase)
+            complete = letters >= set(string.ascii_uppercase)
+            found = {}
+            for letter, urls in (listed or {}).items():
+                for url in urls:
+                    found.setdefault(url, set()).add(letter)
+
+            ## the letters a page was listed under before, less the ones listed now, plus the ones it is under now
+            updates = []
+            for url, url_letters in found.items():
+                previous = self._letters.get(url)
+                current = ''.join(sorted(set(previous or '') - letters | url_letters))
+                if current != previous:
+                    updates.append((current, url))
+                    self._letters[url] = current
+            self.connection.executemany("UPDATE profiles SET letters = ? WHERE url = ?", updates)
+
+            removed = [url for url in self._known if url not in self._seen and (
+                set(self._letters[url]) <= letters if self._letters.get(url) else complete)]
+            self.connection.executemany("UPDATE profiles SET removed = 1 WHERE url = ?", [(url,) for url in removed])
+            self.connection.commit()
+            for url in removed:
+                del self._known[url]
+                self._letters.pop(url, None)
+            self.counts[REMOVED] += len(removed)
+            return removed
+
+    ## commits what is left and closes the file
+    def close(self):
+        self.commit()
+        with self._lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+#######################################################################################################################